@@ -0,0 +1,240 @@
+import io
+import math
+import os
+import shutil
+import subprocess
+import wave
+from typing import Optional
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+
+# Whisper bekerja pada audio mono 16 kHz
+TARGET_SAMPLE_RATE = 16000
+
+# Deteksi suara berbasis energi: frame dianggap ucapan bila RMS-nya di atas ambang
+VAD_FRAME_MS = int(os.getenv("STT_VAD_FRAME_MS", "30"))
+VAD_THRESHOLD_DB = float(os.getenv("STT_VAD_THRESHOLD_DB", "-45"))
+# Ambang relatif terhadap frame paling keras, supaya noise latar yang konstan ikut terpotong
+VAD_DYNAMIC_RANGE_DB = float(os.getenv("STT_VAD_DYNAMIC_RANGE_DB", "35"))
+# Sisakan sedikit jeda di kiri-kanan ucapan agar awal/akhir kata tidak terpotong
+VAD_PADDING_MS = int(os.getenv("STT_VAD_PADDING_MS", "200"))
+
+# WAV/FLAC/OGG (Vorbis, Opus)/MP3 di-decode di dalam proses oleh libsndfile; kontainer lain
+# (WebM/Matroska dari MediaRecorder browser, M4A) dialirkan lewat ffmpeg bila terpasang
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "30"))
+DECODE_BLOCK_FRAMES = 65536
+
+# Sample rate yang diterima encoder Opus
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+class AudioDecodeError(ValueError):
+    pass
+
+
+class SilentAudioError(AudioDecodeError):
+    pass
+
+
+def decode_audio(file_bytes: bytes):
+    """
+    Decode isi file audio langsung dari memori.
+    Returns:
+        (samples, sample_rate): float32 berbentuk (frames, channels).
+    """
+    try:
+        samples, sample_rate = sf.read(io.BytesIO(file_bytes), dtype="float32", always_2d=True)
+    except Exception as e:
+        raise AudioDecodeError(f"Unsupported or corrupt audio: {e}") from e
+    return samples, sample_rate
+
+
+def _decode_with_ffmpeg(file_bytes: bytes) -> np.ndarray:
+    """Decode kontainer apa pun lewat pipe ffmpeg langsung ke PCM float mono 16 kHz."""
+    binary = shutil.which(FFMPEG_BINARY)
+    if binary is None:
+        raise AudioDecodeError("Unsupported audio container and ffmpeg is not installed")
+    cmd = [
+        binary, "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-ac", "1", "-ar", str(TARGET_SAMPLE_RATE), "-f", "f32le", "pipe:1",
+    ]
+    try:
+        result = subprocess.run(cmd, input=file_bytes, capture_output=True, timeout=FFMPEG_TIMEOUT)
+    except subprocess.TimeoutExpired as e:
+        raise AudioDecodeError(f"ffmpeg did not finish within {FFMPEG_TIMEOUT}s") from e
+    if result.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace').strip()[:200]}")
+    return np.frombuffer(result.stdout, dtype="<f4").copy()
+
+
+def decode_mono(file_bytes: bytes, info: Optional[dict] = None):
+    """
+    Decode upload per blok langsung menjadi mono, sehingga rekaman stereo/48 kHz yang
+    panjang tidak perlu ditampung utuh dalam bentuk multi-kanal. Format input dicatat
+    ke `info["input_format"]` bila diberikan.
+    Returns:
+        (samples, sample_rate): float32 mono.
+    """
+    try:
+        with sf.SoundFile(io.BytesIO(file_bytes)) as audio_file:
+            sample_rate = audio_file.samplerate
+            input_format = f"{audio_file.format}/{audio_file.subtype}".lower()
+            blocks = [
+                to_mono(block)
+                for block in audio_file.blocks(DECODE_BLOCK_FRAMES, dtype="float32", always_2d=True)
+            ]
+        samples = np.concatenate(blocks) if blocks else np.empty(0, dtype=np.float32)
+    except Exception as e:
+        # Bukan format libsndfile (misalnya WebM): coba lewat ffmpeg
+        try:
+            samples = _decode_with_ffmpeg(file_bytes)
+        except AudioDecodeError as ffmpeg_error:
+            raise AudioDecodeError(f"Unsupported or corrupt audio: {e}; {ffmpeg_error}") from e
+        sample_rate = TARGET_SAMPLE_RATE
+        input_format = "ffmpeg"
+    if info is not None:
+        info["input_format"] = input_format
+    return samples, sample_rate
+
+
+def to_mono(samples: np.ndarray) -> np.ndarray:
+    if samples.ndim == 1:
+        return samples
+    return samples.mean(axis=1, dtype=np.float32)
+
+
+def resample(samples: np.ndarray, sample_rate: int, target_rate: int = TARGET_SAMPLE_RATE) -> np.ndarray:
+    if sample_rate == target_rate:
+        return samples
+    divisor = math.gcd(sample_rate, target_rate)
+    return resample_poly(samples, target_rate // divisor, sample_rate // divisor).astype(np.float32)
+
+
+class StreamResampler:
+    """
+    Resample audio yang datang per potongan tanpa artefak di batas potongan. Setiap panggilan
+    me-resample ulang sedikit sampel sebelumnya sebagai konteks dan menahan ekor sepanjang
+    setengah filter sampai sampel sesudahnya datang, sehingga hasilnya sama dengan me-resample
+    seluruh sinyal sekaligus (tertunda kurang dari 1 ms).
+    """
+
+    def __init__(self, sample_rate: int, target_rate: int = TARGET_SAMPLE_RATE):
+        divisor = math.gcd(sample_rate, target_rate)
+        self.up = target_rate // divisor
+        self.down = sample_rate // divisor
+        # resample_poly memakai FIR dengan setengah panjang 10 * max(up, down) pada laju upsampling;
+        # konteks dibulatkan ke kelipatan `down` agar grid sampel keluaran tetap sejajar
+        half_len = -(-10 * max(self.up, self.down) // self.up) + 1
+        self._context = -(-half_len // self.down) * self.down
+        self._buffer = np.empty(0, dtype=np.float32)
+        self._offset = 0  # indeks sampel masukan pertama di buffer
+        self._produced = 0  # jumlah sampel keluaran yang sudah dikembalikan
+
+    def _segment_start(self) -> int:
+        start = (self._produced * self.down // self.up - self._context) // self.down * self.down
+        return max(self._offset, start)
+
+    def process(self, samples: np.ndarray, final: bool = False) -> np.ndarray:
+        if self.up == self.down:
+            return samples
+        self._buffer = np.concatenate([self._buffer, samples.astype(np.float32, copy=False)])
+        end = self._offset + len(self._buffer)
+        limit = end if final else end - self._context
+        produce_to = max(0, -(-limit * self.up // self.down))
+        if produce_to <= self._produced:
+            return np.empty(0, dtype=np.float32)
+        start = self._segment_start()
+        output = resample_poly(self._buffer[start - self._offset:], self.up, self.down)
+        first = start * self.up // self.down
+        result = output[self._produced - first:produce_to - first].astype(np.float32)
+        self._produced = produce_to
+        keep_from = self._segment_start()
+        self._buffer = self._buffer[keep_from - self._offset:]
+        self._offset = keep_from
+        return result
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int = TARGET_SAMPLE_RATE) -> bytes:
+    """Bungkus sampel float mono menjadi WAV PCM 16-bit di memori."""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def encode_opus(wav_bytes: bytes, bitrate: int) -> bytes:
+    """
+    Kompres audio WAV menjadi Ogg Opus di memori dengan bitrate target (bit/detik).
+    Opus hanya menerima 8/12/16/24/48 kHz, jadi audio di-resample ke rate terdekat di atasnya.
+    """
+    samples, sample_rate = decode_audio(wav_bytes)
+    samples = to_mono(samples)
+    target_rate = next((rate for rate in OPUS_SAMPLE_RATES if rate >= sample_rate), OPUS_SAMPLE_RATES[-1])
+    samples = resample(samples, sample_rate, target_rate)
+    # libsndfile memetakan compression_level 0..1 secara linear ke 256..6 kbps
+    level = min(1.0, max(0.0, (256000 - bitrate) / 250000))
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, target_rate, format="OGG", subtype="OPUS", compression_level=level)
+    return buffer.getvalue()
+
+
+def frame_energy_db(samples: np.ndarray, sample_rate: int, frame_ms: int = VAD_FRAME_MS) -> np.ndarray:
+    """Energi RMS (dBFS) per frame, dihitung sekaligus untuk seluruh sinyal."""
+    frame_length = max(1, sample_rate * frame_ms // 1000)
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return np.empty(0, dtype=np.float32)
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def trim_silence(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Potong hening di awal dan akhir klip.
+    Raises:
+        SilentAudioError: Jika tidak ada frame yang terdeteksi sebagai ucapan.
+    """
+    energy = frame_energy_db(samples, sample_rate)
+    if energy.size == 0:
+        raise SilentAudioError("Audio too short")
+
+    threshold = max(VAD_THRESHOLD_DB, float(energy.max()) - VAD_DYNAMIC_RANGE_DB)
+    voiced = np.flatnonzero(energy > threshold)
+    if voiced.size == 0:
+        raise SilentAudioError("No speech detected")
+
+    frame_length = max(1, sample_rate * VAD_FRAME_MS // 1000)
+    padding = sample_rate * VAD_PADDING_MS // 1000
+    start = max(0, voiced[0] * frame_length - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame_length + padding)
+    return samples[start:end]
+
+
+def load_for_stt(file_bytes: bytes, info: Optional[dict] = None) -> np.ndarray:
+    """
+    Decode upload menjadi sampel mono 16 kHz siap untuk whisper, tanpa file sementara:
+    downmix ke mono, resample ke 16 kHz, lalu potong hening di awal/akhir.
+    Durasi sebelum dan sesudah trimming dicatat ke `info` bila diberikan.
+    Raises:
+        AudioDecodeError: Jika audio tidak bisa di-decode.
+        SilentAudioError: Jika klip hanya berisi hening.
+    """
+    samples, sample_rate = decode_mono(file_bytes, info)
+    samples = resample(samples, sample_rate)
+    if info is not None:
+        info["audio_seconds"] = round(len(samples) / TARGET_SAMPLE_RATE, 3)
+        info["speech_seconds"] = 0.0
+
+    samples = trim_silence(samples, TARGET_SAMPLE_RATE)
+    if info is not None:
+        info["speech_seconds"] = round(len(samples) / TARGET_SAMPLE_RATE, 3)
+    return samples
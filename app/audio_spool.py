@@ -0,0 +1,180 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SpooledAudio:
+    """Satu hasil audio di spool: isinya di memori, atau di file bila terlalu besar."""
+
+    def __init__(self, audio_id: str, size: int, expires_at: float,
+                 data: Optional[bytes] = None, path: Optional[str] = None):
+        self.id = audio_id
+        self.size = size
+        self.expires_at = expires_at
+        self.data = data
+        self.path = path
+
+    @property
+    def in_memory(self) -> bool:
+        return self.data is not None
+
+    def read(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class AudioSpool:
+    """
+    Penyimpanan sementara audio balasan. Audio kecil disimpan di memori, audio besar
+    (atau saat kuota memori penuh) ditulis ke disk dalam batas kuota byte. Setiap
+    artefak kedaluwarsa setelah `ttl` detik dan dibersihkan oleh thread sweeper.
+    """
+
+    def __init__(self, directory: str, memory_threshold: int, memory_bytes: int,
+                 disk_bytes: int, ttl: float, sweep_interval: float = 30):
+        self.directory = directory
+        self.memory_threshold = memory_threshold
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._items = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.spilled = 0
+        self.evicted = 0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._remove_stale_files()
+        self._stop_event = threading.Event()
+        if self.sweep_interval > 0:
+            threading.Thread(
+                target=self._sweep_loop, args=(self._stop_event,), name="audio-spool-sweeper", daemon=True
+            ).start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _remove_stale_files(self):
+        # File dari run sebelumnya (termasuk tts_<uuid>.wav lama) yang sudah lewat TTL
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def put(self, data: bytes) -> SpooledAudio:
+        size = len(data)
+        audio_id = uuid.uuid4().hex
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            if size <= self.memory_threshold and self._memory_size + size <= self.memory_bytes:
+                item = SpooledAudio(audio_id, size, expires_at, data=data)
+                self._memory_size += size
+                self._items[audio_id] = item
+                return item
+            self._make_disk_room(size)
+
+        path = os.path.join(self.directory, f"{audio_id}.wav")
+        try:
+            with open(path, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            # Disk penuh/tidak bisa ditulis: tetap layani dari memori
+            logger.warning("Failed to spill audio to disk: %s", e)
+            item = SpooledAudio(audio_id, size, expires_at, data=data)
+            with self._lock:
+                self._memory_size += size
+                self._items[audio_id] = item
+            return item
+
+        item = SpooledAudio(audio_id, size, expires_at, path=path)
+        with self._lock:
+            self._disk_size += size
+            self._items[audio_id] = item
+            self.spilled += 1
+        return item
+
+    def _make_disk_room(self, size: int):
+        # Buang artefak disk terlama sampai yang baru muat dalam kuota
+        for audio_id in list(self._items):
+            if self._disk_size + size <= self.disk_bytes:
+                break
+            item = self._items[audio_id]
+            if not item.in_memory:
+                self._remove(item)
+                self.evicted += 1
+
+    def _remove(self, item: SpooledAudio):
+        self._items.pop(item.id, None)
+        if item.in_memory:
+            self._memory_size -= item.size
+        else:
+            self._disk_size -= item.size
+            try:
+                os.remove(item.path)
+            except OSError:
+                pass
+
+    def get(self, audio_id: str) -> Optional[SpooledAudio]:
+        with self._lock:
+            item = self._items.get(audio_id)
+            if item is not None and item.expires_at <= time.monotonic():
+                self._remove(item)
+                return None
+        if item is None:
+            item = self._get_foreign(audio_id)
+        return item
+
+    def _get_foreign(self, audio_id: str) -> Optional[SpooledAudio]:
+        # Audio yang di-spill ke disk oleh proses lain (worker uvicorn lain) dengan direktori yang sama
+        if not audio_id.isalnum():
+            return None
+        path = os.path.join(self.directory, f"{audio_id}.wav")
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        remaining = stat.st_mtime + self.ttl - time.time()
+        if remaining <= 0:
+            return None
+        return SpooledAudio(audio_id, stat.st_size, time.monotonic() + remaining, path=path)
+
+    def sweep(self) -> int:
+        """Hapus semua artefak yang sudah kedaluwarsa; mengembalikan jumlahnya."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [item for item in self._items.values() if item.expires_at <= now]
+            for item in expired:
+                self._remove(item)
+        return len(expired)
+
+    def _sweep_loop(self, stop_event: threading.Event):
+        while not stop_event.wait(self.sweep_interval):
+            removed = self.sweep()
+            if removed:
+                logger.debug("Swept %d expired audio artifacts", removed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "memory_bytes": self._memory_size,
+                "disk_bytes": self._disk_size,
+                "spilled": self.spilled,
+                "evicted": self.evicted,
+            }
@@ -0,0 +1,58 @@
+def estimate_tokens(text: str) -> int:
+    # Perkiraan kasar tanpa tokenizer: sekitar 4 karakter per token
+    return max(1, len(text) // 4)
+
+
+def message_tokens(message: dict) -> int:
+    return sum(estimate_tokens(part) for part in message["parts"])
+
+
+def format_transcript(messages: list) -> str:
+    return "\n".join(
+        f"{'User' if message['role'] == 'user' else 'Assistant'}: {' '.join(message['parts'])}"
+        for message in messages
+    )
+
+
+class ConversationWindow:
+    """
+    Riwayat satu sesi beserta ringkasan berjalannya. Prompt untuk Gemini hanya berisi
+    beberapa giliran terakhir dalam batas token; giliran yang lebih lama diwakili
+    ringkasan (pesan sebelum `summarized_count` sudah masuk ringkasan).
+    """
+
+    def __init__(self, history: list, summary: str = "", summarized_count: int = 0):
+        self.history = history
+        self.summary = summary
+        self.summarized_count = summarized_count
+        self.summarizing = False
+
+    def window_start(self, max_turns: int, token_budget: int, reserved_tokens: int = 0) -> int:
+        """Indeks pesan pertama yang masuk prompt: giliran utuh dari belakang, minimal satu."""
+        start = len(self.history)
+        used = reserved_tokens
+        turns = 0
+        while start > self.summarized_count and turns < max_turns:
+            turn_start = start - 1
+            while turn_start > self.summarized_count and self.history[turn_start]["role"] != "user":
+                turn_start -= 1
+            cost = sum(message_tokens(message) for message in self.history[turn_start:start])
+            if turns > 0 and used + cost > token_budget:
+                break
+            used += cost
+            turns += 1
+            start = turn_start
+        # Gemini mengharapkan percakapan dimulai dari pesan user
+        while start < len(self.history) and self.history[start]["role"] != "user":
+            start += 1
+        return start
+
+    def build(self, message: dict, max_turns: int, token_budget: int) -> list:
+        """Pesan yang dikirim untuk giliran ini: jendela riwayat lalu pesan baru."""
+        start = self.window_start(max_turns, token_budget, message_tokens(message))
+        return self.history[start:] + [message]
+
+    def system_instruction(self, base: str) -> str:
+        if not self.summary:
+            return base
+        return f"{base}\n\nSummary of the earlier part of this conversation:\n{self.summary}"
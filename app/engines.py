@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from app.metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+ENGINE_READY = Gauge(
+    "voice_engine_ready",
+    "1 when the engine is loaded and warmed up, 0 otherwise",
+    ("engine",),
+)
+
+
+class Engine:
+    """
+    Engine yang dimuat saat pertama kali dibutuhkan: `load` memuat model, lalu
+    `warmup` menjalankan satu inferensi dummy agar request pertama tidak ikut
+    menanggung biaya alokasi awal. Aman dipanggil dari banyak thread sekaligus.
+    """
+
+    def __init__(self, name: str, load: Callable[[], None],
+                 warmup: Optional[Callable[[], None]] = None,
+                 unload: Optional[Callable[[], None]] = None):
+        self.name = name
+        self._load = load
+        self._warmup = warmup
+        self._unload = unload
+        self._lock = threading.Lock()
+        self.state = "idle"  # idle -> loading -> ready, atau failed
+        self.error = None
+        self.load_seconds = None
+        ENGINE_READY.set(0, engine=name)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def ensure(self):
+        """Muat dan hangatkan engine bila belum; request lain menunggu proses yang sama."""
+        if self.state == "ready":
+            return
+        with self._lock:
+            if self.state == "ready":
+                return
+            self.state = "loading"
+            start = time.perf_counter()
+            try:
+                self._load()
+                if self._warmup is not None:
+                    self._warmup()
+            except Exception as e:
+                # Dicoba lagi pada pemanggilan berikutnya
+                self.state = "failed"
+                self.error = str(e)
+                raise
+            self.load_seconds = round(time.perf_counter() - start, 3)
+            self.state = "ready"
+            self.error = None
+            ENGINE_READY.set(1, engine=self.name)
+            logger.info("Engine %s ready in %.2fs", self.name, self.load_seconds)
+
+    def shutdown(self):
+        with self._lock:
+            if self._unload is not None and self.state != "idle":
+                self._unload()
+            self.state = "idle"
+            ENGINE_READY.set(0, engine=self.name)
+
+    def status(self) -> dict:
+        status = {"state": self.state}
+        if self.load_seconds is not None:
+            status["load_seconds"] = self.load_seconds
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+_registry = {}
+
+
+def register_engine(engine: Engine) -> Engine:
+    _registry[engine.name] = engine
+    return engine
+
+
+def get_engine(name: str) -> Engine:
+    return _registry[name]
+
+
+def engines_ready() -> bool:
+    return all(engine.ready for engine in _registry.values())
+
+
+def engine_status() -> dict:
+    return {name: engine.status() for name, engine in _registry.items()}
+
+
+def _warmup_all():
+    for engine in list(_registry.values()):
+        try:
+            engine.ensure()
+        except Exception as e:
+            logger.error("Failed to warm up engine %s: %s", engine.name, e)
+
+
+def warmup_engines_in_background() -> threading.Thread:
+    """Muat dan hangatkan semua engine terdaftar tanpa menahan startup server."""
+    thread = threading.Thread(target=_warmup_all, name="engine-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def shutdown_engines():
+    for engine in list(_registry.values()):
+        try:
+            engine.shutdown()
+        except Exception as e:
+            logger.error("Failed to stop engine %s: %s", engine.name, e)
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import random
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+from app.metrics import LLM_HEDGED, LLM_RETRIES
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiError(RuntimeError):
+    pass
+
+
+class RetryableGeminiError(GeminiError):
+    """Error sementara (timeout, 429, 5xx) yang boleh dicoba ulang."""
+
+
+def to_contents(messages: list) -> list:
+    # Format riwayat sesi {"role", "parts": [str]} -> format REST Gemini
+    return [
+        {"role": message["role"], "parts": [{"text": text} for text in message["parts"]]}
+        for message in messages
+    ]
+
+
+def _response_text(data: dict) -> str:
+    candidates = data.get("candidates") or []
+    if not candidates:
+        reason = (data.get("promptFeedback") or {}).get("blockReason", "no candidates")
+        raise GeminiError(f"Gemini returned no answer: {reason}")
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+class GeminiClient:
+    """
+    Client REST Gemini yang async dengan koneksi HTTP yang dipakai ulang, batas waktu
+    per panggilan, retry terbatas dengan jitter, dan hedging opsional: bila jawaban
+    belum datang setelah `hedge_after` detik, request duplikat dikirim dan jawaban
+    pertama yang berhasil dipakai.
+    """
+
+    def __init__(self, api_key: str, model: str, base_url: str,
+                 deadline: float = 30, attempt_timeout: float = 15,
+                 max_retries: int = 2, retry_backoff: float = 0.5,
+                 hedge_after: float = 0, max_connections: int = 32):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.hedge_after = hedge_after
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(attempt_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    def _url(self, method: str) -> str:
+        return f"{self.base_url}/models/{self.model}:{method}"
+
+    def _payload(self, contents: list, system_instruction: Optional[str] = None) -> dict:
+        payload = {"contents": contents}
+        if system_instruction:
+            payload["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        return payload
+
+    @staticmethod
+    def _check_status(response: httpx.Response, body: str):
+        if response.status_code == 429 or response.status_code >= 500:
+            raise RetryableGeminiError(f"Gemini HTTP {response.status_code}: {body[:200]}")
+        if response.status_code != 200:
+            raise GeminiError(f"Gemini HTTP {response.status_code}: {body[:200]}")
+
+    async def _post(self, payload: dict) -> str:
+        try:
+            response = await self._client.post(
+                self._url("generateContent"), params={"key": self.api_key}, json=payload
+            )
+        except httpx.TransportError as e:
+            raise RetryableGeminiError(f"Gemini request failed: {e!r}") from e
+        self._check_status(response, response.text)
+        return _response_text(response.json())
+
+    async def _open_stream(self, payload: dict):
+        """Buka stream SSE dan tunggu potongan teks pertama; hasilnya (response, baris, teks pertama)."""
+        request = self._client.build_request(
+            "POST", self._url("streamGenerateContent"), params={"key": self.api_key, "alt": "sse"}, json=payload
+        )
+        try:
+            response = await self._client.send(request, stream=True)
+        except httpx.TransportError as e:
+            raise RetryableGeminiError(f"Gemini request failed: {e!r}") from e
+        try:
+            if response.status_code != 200:
+                self._check_status(response, (await response.aread()).decode("utf-8", "replace"))
+            lines = response.aiter_lines()
+            async for line in lines:
+                if line.startswith("data:"):
+                    text = _response_text(json.loads(line[len("data:"):]))
+                    if text:
+                        return response, lines, text
+            return response, lines, ""
+        except httpx.TransportError as e:
+            await response.aclose()
+            raise RetryableGeminiError(f"Gemini stream failed: {e!r}") from e
+        except BaseException:
+            await response.aclose()
+            raise
+
+    async def _hedged(self, attempt: Callable[[], Awaitable], discard: Optional[Callable] = None):
+        tasks = {asyncio.ensure_future(attempt())}
+        try:
+            if self.hedge_after > 0:
+                done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+                if not done:
+                    LLM_HEDGED.inc()
+                    logger.debug("Gemini call slower than %.2fs, sending hedged request", self.hedge_after)
+                    tasks.add(asyncio.ensure_future(attempt()))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in done if task.exception() is None]
+                if winners:
+                    # Dua request bisa selesai bersamaan; sisanya dibuang
+                    for loser in winners[1:]:
+                        if discard is not None:
+                            await discard(loser.result())
+                    return winners[0].result()
+                error = next(iter(done)).exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            for task in tasks:
+                try:
+                    result = await task
+                except BaseException:
+                    continue
+                if discard is not None:
+                    await discard(result)
+
+    async def _call(self, attempt: Callable[[], Awaitable], discard: Optional[Callable] = None):
+        for retry in range(self.max_retries + 1):
+            try:
+                return await self._hedged(attempt, discard)
+            except RetryableGeminiError as e:
+                if retry == self.max_retries:
+                    raise
+                # Exponential backoff dengan full jitter agar retry tidak serempak
+                delay = random.uniform(0, self.retry_backoff * (2 ** retry))
+                LLM_RETRIES.inc()
+                logger.warning("Gemini call failed (%s), retrying in %.2fs", e, delay)
+                await asyncio.sleep(delay)
+
+    async def generate(self, contents: list, system_instruction: Optional[str] = None) -> str:
+        """
+        Satu panggilan generateContent dengan batas waktu total `deadline` (termasuk retry).
+        Raises:
+            GeminiError: Jika Gemini gagal menjawab.
+            asyncio.TimeoutError: Jika batas waktu terlewati.
+        """
+        payload = self._payload(contents, system_instruction)
+        return await asyncio.wait_for(self._call(lambda: self._post(payload)), self.deadline)
+
+    async def stream(self, contents: list, system_instruction: Optional[str] = None):
+        """
+        Versi streaming dari generate: menghasilkan potongan teks begitu tiba. Retry dan
+        hedging hanya berlaku sebelum potongan pertama diterima.
+        """
+        payload = self._payload(contents, system_instruction)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        async def discard(result):
+            await result[0].aclose()
+
+        response, lines, first = await asyncio.wait_for(
+            self._call(lambda: self._open_stream(payload), discard), self.deadline
+        )
+        try:
+            if first:
+                yield first
+            async for line in lines:
+                if loop.time() - started > self.deadline:
+                    raise asyncio.TimeoutError(f"Gemini stream exceeded {self.deadline}s")
+                if line.startswith("data:"):
+                    text = _response_text(json.loads(line[len("data:"):]))
+                    if text:
+                        yield text
+        except httpx.TransportError as e:
+            raise GeminiError(f"Gemini stream failed: {e!r}") from e
+        finally:
+            await response.aclose()
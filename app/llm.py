@@ -1,7 +1,19 @@
+import asyncio
 import json
+import logging
 import os
-import google.generativeai as genai
+import re
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
+from typing import Optional
+from app.engines import Engine, register_engine
+from app.context_window import ConversationWindow, estimate_tokens, format_transcript, message_tokens
+from app.gemini_client import GeminiClient, to_contents
+from app.response_cache import ResponseCache
+from app.session_store import SessionStore
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
@@ -9,14 +21,36 @@ load_dotenv()
 # Pastikan di file .env terdapat baris: GEMINI_API_KEY=your_api_key
 GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GOOGLE_API_KEY:
-    print("[ERROR] GEMINI_API_KEY not found in environment variables")
+    logger.error("GEMINI_API_KEY not found in environment variables")
 
 MODEL = "gemini-2.0-flash"
+# Bisa diarahkan ke server tiruan lokal untuk pengujian (lihat bench/gemini_standin.py)
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+
+# Batas waktu total per panggilan (termasuk retry), per percobaan, dan kebijakan retry/hedging
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "15"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+# Kirim request duplikat bila jawaban belum datang setelah sekian detik (0 = tanpa hedging)
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CHAT_HISTORY_FILE = os.path.join(BASE_DIR, "chat_history.json")
+SESSION_DB_FILE = os.getenv("SESSION_DB_FILE", os.path.join(BASE_DIR, "chat_history.db"))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "256"))
+DEFAULT_SESSION_ID = "default"
+
+# Akhir kalimat: tanda baca penutup yang diikuti spasi (agar "1.000" atau "3.5" tidak terpotong)
+SENTENCE_END_PATTERN = re.compile(r"(?:(?<=[.!?…])|(?<=[.!?…][\"')\]]))\s+")
 
 # Pastikan folder untuk history ada
-os.makedirs(os.path.dirname(CHAT_HISTORY_FILE), exist_ok=True)
+os.makedirs(os.path.dirname(SESSION_DB_FILE), exist_ok=True)
+
+# Riwayat per sesi disimpan di SQLite; sesi aktif di-cache di memori dengan batas LRU
+session_store = SessionStore(SESSION_DB_FILE)
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
 
 # Prompt sistem yang digunakan untuk membimbing gaya respons LLM
 system_instruction = """ 
@@ -38,61 +72,299 @@ Assistant: Presiden Indonesia saat ini adalah Joko Widodo.
 If you're unsure about an answer, be honest and say that you don't know. 
 """ 
 
-try:
-    genai.configure(api_key=GOOGLE_API_KEY)
-    model = genai.GenerativeModel(model_name=MODEL)
-    print(f"[INFO] Successfully configured Gemini API with model: {MODEL}")
-except Exception as e:
-    print(f"[ERROR] Failed to configure Gemini API: {e}")
-    model = None
+# Jendela konteks: hanya N giliran terakhir dalam batas token yang dikirim ke Gemini,
+# giliran yang lebih lama dilipat ke ringkasan berjalan
+LLM_CONTEXT_MAX_TURNS = int(os.getenv("LLM_CONTEXT_MAX_TURNS", "6"))
+LLM_CONTEXT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "1500"))
+LLM_SUMMARY_MAX_WORDS = int(os.getenv("LLM_SUMMARY_MAX_WORDS", "120"))
+
+summary_instruction = """
+Update the running summary of a conversation between a user and an Indonesian voice assistant.
+Merge the previous summary with the new messages. Keep names, facts, preferences and open
+questions that later turns may refer to; drop small talk. Write in Indonesian, in at most
+{max_words} words, and reply with the summary only.
+
+Previous summary:
+{summary}
+
+New messages:
+{transcript}
+"""
+
+# Cache balasan untuk pertanyaan yang sering berulang (0 entri = nonaktif)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "256"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+# Jumlah pesan terakhir di riwayat yang ikut menentukan kunci cache (konteks percakapan)
+LLM_CACHE_CONTEXT_MESSAGES = int(os.getenv("LLM_CACHE_CONTEXT_MESSAGES", "2"))
+
+response_cache = ResponseCache(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL, namespace=MODEL + system_instruction)
+
+# Client Gemini baru dibuat saat pertama kali dibutuhkan (atau saat warmup)
+client = None
 
-def save_chat_history(chat):
+def _create_client():
+    global client
+    if client is not None:
+        return
+    client = GeminiClient(
+        GOOGLE_API_KEY or "",
+        MODEL,
+        GEMINI_API_BASE,
+        deadline=LLM_TIMEOUT,
+        attempt_timeout=LLM_ATTEMPT_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        retry_backoff=LLM_RETRY_BACKOFF,
+        hedge_after=LLM_HEDGE_AFTER,
+        max_connections=LLM_MAX_CONNECTIONS,
+    )
+    logger.info("Successfully configured Gemini API with model: %s", MODEL)
+
+llm_engine = register_engine(Engine("llm", _create_client))
+
+def get_client() -> Optional[GeminiClient]:
+    """Kembalikan client Gemini, atau None bila gagal dikonfigurasi."""
     try:
-        history = chat.history
-        with open(CHAT_HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f)
-        print(f"[INFO] Chat history saved to {CHAT_HISTORY_FILE}")
+        llm_engine.ensure()
     except Exception as e:
-        print(f"[ERROR] Failed to save chat history: {e}")
+        logger.error("Failed to configure Gemini API: %s", e)
+    return client
+
+async def close_client():
+    global client
+    if client is not None:
+        await client.aclose()
+        client = None
 
-def load_chat_history():
+def _load_legacy_history() -> list:
+    # Riwayat lama dari chat_history.json dipindahkan ke sesi default
     try:
         if os.path.exists(CHAT_HISTORY_FILE) and os.path.getsize(CHAT_HISTORY_FILE) > 0:
             with open(CHAT_HISTORY_FILE, "r", encoding="utf-8") as f:
                 history = json.load(f)
-            print(f"[INFO] Chat history loaded from {CHAT_HISTORY_FILE}")
-            return model.start_chat(history=history)
+            if isinstance(history, list):
+                return [m for m in history if isinstance(m, dict) and "role" in m and "parts" in m]
     except Exception as e:
-        print(f"[ERROR] Failed to load chat history: {e}")
-    
-    print("[INFO] Starting new chat session")
-    return model.start_chat()
-
-# Initialize chat instance
-try:
-    chat = load_chat_history()
-except Exception as e:
-    print(f"[ERROR] Failed to initialize chat: {e}")
-    chat = None
-
-def generate_response(prompt: str) -> str:
-    if not model or not chat:
+        logger.error("Failed to load legacy chat history: %s", e)
+    return []
+
+def _is_instruction_turn(history: list) -> bool:
+    # Sesi lama mengirim instruksi sistem sebagai pesan user pertama
+    return bool(history) and history[0]["role"] == "user" and \
+        " ".join(history[0]["parts"]).strip() == system_instruction.strip()
+
+def _load_window(session_id: str) -> ConversationWindow:
+    history = session_store.load(session_id)
+    if not history and session_id == DEFAULT_SESSION_ID:
+        # Worker lain bisa memigrasi riwayat lama pada saat yang sama; hanya satu yang menulis
+        session_store.append_if_empty(session_id, _load_legacy_history())
+        history = session_store.load(session_id)
+    summary, summarized_count = session_store.load_summary(session_id)
+    if _is_instruction_turn(history):
+        # Instruksi kini dipasang di model; pasangan instruksi + jawabannya tidak ikut dikirim lagi
+        summarized_count = max(summarized_count, 2)
+    logger.debug("Loaded session %s with %d messages", session_id, len(history))
+    return ConversationWindow(history, summary, summarized_count)
+
+async def get_chat_session(session_id: str):
+    """
+    Ambil jendela percakapan sesi (riwayat + ringkasan) dan lock-nya dari cache LRU,
+    atau muat dari store bila belum ada.
+    """
+    with _sessions_lock:
+        entry = _sessions.get(session_id)
+        if entry is not None:
+            _sessions.move_to_end(session_id)
+            return entry
+
+    window = await asyncio.to_thread(_load_window, session_id)
+
+    with _sessions_lock:
+        entry = _sessions.get(session_id)
+        if entry is None:
+            entry = (window, asyncio.Lock())
+            _sessions[session_id] = entry
+        _sessions.move_to_end(session_id)
+        # Sesi yang lock-nya sedang dipegang tidak dibuang: giliran berikutnya harus menunggu
+        # lock yang sama, bukan memuat jendela baru dan berjalan bersamaan
+        for key in [key for key, (_, lock) in _sessions.items() if not lock.locked() and key != session_id]:
+            if len(_sessions) <= SESSION_CACHE_SIZE:
+                break
+            del _sessions[key]
+        return entry
+
+def _newer_messages(session_id: str, window: ConversationWindow):
+    newer = session_store.load(session_id, len(window.history))
+    summary = session_store.load_summary(session_id) if newer else None
+    return newer, summary
+
+async def _sync_window(session_id: str, window: ConversationWindow):
+    """
+    Tambahkan giliran yang ditulis proses lain (worker uvicorn lain) sejak jendela ini
+    dimuat, supaya semua worker melihat percakapan yang sama. Dipanggil dengan lock sesi dipegang.
+    """
+    newer, summary = await asyncio.to_thread(_newer_messages, session_id, window)
+    if not newer:
+        return
+    window.history.extend(newer)
+    if summary[1] > window.summarized_count and not window.summarizing:
+        window.summary, window.summarized_count = summary
+    logger.debug("Synced %d new messages of session %s from the store", len(newer), session_id)
+
+_background_tasks = set()
+
+async def _summarize(gemini: GeminiClient, session_id: str, window: ConversationWindow, upto: int):
+    older = window.history[window.summarized_count:upto]
+    prompt = summary_instruction.format(
+        max_words=LLM_SUMMARY_MAX_WORDS,
+        summary=window.summary or "(none)",
+        transcript=format_transcript(older),
+    )
+    try:
+        summary = (await gemini.generate(to_contents([{"role": "user", "parts": [prompt]}]))).strip()
+        window.summary = summary
+        window.summarized_count = upto
+        await asyncio.to_thread(session_store.save_summary, session_id, summary, upto)
+        logger.debug("Summarized %d messages of session %s (%d tokens)", len(older), session_id, estimate_tokens(summary))
+    except Exception as e:
+        logger.warning("Failed to update summary of session %s: %s", session_id, e)
+    finally:
+        window.summarizing = False
+
+def _schedule_summary(gemini: GeminiClient, session_id: str, window: ConversationWindow):
+    """Lipat giliran yang sudah keluar dari jendela ke ringkasan, di background agar giliran berikutnya tidak menunggu."""
+    upto = window.window_start(LLM_CONTEXT_MAX_TURNS, LLM_CONTEXT_TOKEN_BUDGET)
+    if window.summarizing or upto <= window.summarized_count:
+        return
+    window.summarizing = True
+    task = asyncio.ensure_future(_summarize(gemini, session_id, window, upto))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _append_turn(session_id: str, window: ConversationWindow, messages: list):
+    window.history.extend(messages)
+    await asyncio.to_thread(session_store.append, session_id, messages)
+
+def _cache_key(prompt: str, history: list) -> str:
+    context = history[-LLM_CACHE_CONTEXT_MESSAGES:] if LLM_CACHE_CONTEXT_MESSAGES > 0 else []
+    return response_cache.key(prompt, context)
+
+async def _lookup_cache(prompt: str, session_id: str, window: ConversationWindow, info: Optional[dict], use_cache: bool):
+    """
+    Cari balasan di cache (dipanggil dengan lock sesi dipegang). Bila hit, giliran
+    dari cache langsung ditambahkan ke riwayat sesi. Mengembalikan (kunci, entri).
+    """
+    if not use_cache or not response_cache.enabled:
+        if info is not None:
+            info["cache"] = "bypass"
+        return None, None
+    cache_key = _cache_key(prompt, window.history)
+    cached = response_cache.get(cache_key)
+    if info is not None:
+        info["cache"] = "hit" if cached is not None else "miss"
+        info["cache_key"] = cache_key
+    if cached is not None:
+        logger.debug("Response cache hit for %r (session: %s)", prompt, session_id)
+        await _append_turn(session_id, window, cached["messages"])
+    return cache_key, cached
+
+def _prepare_turn(window: ConversationWindow, user_message: dict, info: Optional[dict]):
+    """Susun isi prompt (jendela riwayat + pesan baru) dan instruksi sistem untuk giliran ini."""
+    messages = window.build(user_message, LLM_CONTEXT_MAX_TURNS, LLM_CONTEXT_TOKEN_BUDGET)
+    instruction = window.system_instruction(system_instruction)
+    if info is not None:
+        info["context_messages"] = len(messages) - 1
+        info["prompt_tokens"] = estimate_tokens(instruction) + sum(message_tokens(m) for m in messages)
+    return to_contents(messages), instruction
+
+async def generate_response(prompt: str, session_id: str = DEFAULT_SESSION_ID,
+                            info: Optional[dict] = None, use_cache: bool = True) -> str:
+    """
+    Kirim prompt ke Gemini dalam sesi `session_id`. Pertanyaan yang sama pada konteks
+    yang sama dijawab dari cache; status cache dicatat ke `info` bila diberikan.
+    """
+    gemini = get_client()
+    if not gemini:
         return "[ERROR] Gemini API not properly initialized"
         
     try:
-        print(f"[INFO] Processing user prompt: '{prompt}'")
+        logger.debug("Processing user prompt: %r (session: %s)", prompt, session_id)
+        window, session_lock = await get_chat_session(session_id)
         
-        if not chat.history:
-            print("[INFO] Sending system instruction to new chat")
-            chat.send_message(system_instruction)
-        
-        response = chat.send_message(prompt)
-        response_text = response.text.strip()
-        
-        print(f"[INFO] Gemini response: '{response_text}'")
-        save_chat_history(chat)
+        # Giliran dalam satu sesi diproses berurutan, sesi berbeda berjalan paralel
+        async with session_lock:
+            await _sync_window(session_id, window)
+            cache_key, cached = await _lookup_cache(prompt, session_id, window, info, use_cache)
+            if cached is not None:
+                _schedule_summary(gemini, session_id, window)
+                return cached["response_text"]
+
+            user_message = {"role": "user", "parts": [prompt]}
+            contents, instruction = _prepare_turn(window, user_message, info)
+            response_text = (await gemini.generate(contents, instruction)).strip()
+            
+            logger.debug("Gemini response: %r", response_text)
+            turn_messages = [user_message, {"role": "model", "parts": [response_text]}]
+            await _append_turn(session_id, window, turn_messages)
+            if cache_key is not None:
+                response_cache.put(cache_key, response_text, turn_messages)
+            _schedule_summary(gemini, session_id, window)
         
         return response_text
+    except asyncio.TimeoutError:
+        logger.error("Gemini did not answer within %ss", LLM_TIMEOUT)
+        return f"[ERROR] Gemini did not answer within {LLM_TIMEOUT}s"
     except Exception as e:
-        print(f"[ERROR] Failed to generate response: {e}")
-        return f"[ERROR] {e}"
\ No newline at end of file
+        logger.error("Failed to generate response: %s", e)
+        return f"[ERROR] {e}"
+
+async def generate_response_stream(prompt: str, session_id: str = DEFAULT_SESSION_ID,
+                                   info: Optional[dict] = None, use_cache: bool = True):
+    """
+    Versi streaming dari generate_response: menghasilkan potongan teks dari Gemini
+    begitu tiba. Riwayat sesi disimpan setelah stream selesai; bila cache hit,
+    seluruh balasan dari cache dikirim sebagai satu potongan.
+    Raises:
+        RuntimeError: Jika Gemini belum terkonfigurasi.
+    """
+    gemini = get_client()
+    if not gemini:
+        raise RuntimeError("Gemini API not properly initialized")
+
+    logger.debug("Processing user prompt (stream): %r (session: %s)", prompt, session_id)
+    window, session_lock = await get_chat_session(session_id)
+
+    async with session_lock:
+        await _sync_window(session_id, window)
+        cache_key, cached = await _lookup_cache(prompt, session_id, window, info, use_cache)
+        if cached is not None:
+            _schedule_summary(gemini, session_id, window)
+            yield cached["response_text"]
+            return
+
+        user_message = {"role": "user", "parts": [prompt]}
+        contents, instruction = _prepare_turn(window, user_message, info)
+        chunks = []
+        async for chunk in gemini.stream(contents, instruction):
+            chunks.append(chunk)
+            yield chunk
+
+        response_text = "".join(chunks).strip()
+        turn_messages = [user_message, {"role": "model", "parts": [response_text]}]
+        await _append_turn(session_id, window, turn_messages)
+        if cache_key is not None:
+            response_cache.put(cache_key, response_text, turn_messages)
+        _schedule_summary(gemini, session_id, window)
+
+async def iter_sentences(chunks):
+    """Gabungkan potongan teks stream lalu keluarkan per kalimat utuh."""
+    buffer = ""
+    async for chunk in chunks:
+        buffer += chunk
+        parts = SENTENCE_END_PATTERN.split(buffer)
+        # Bagian terakhir mungkin kalimat yang belum selesai
+        for sentence in parts[:-1]:
+            if sentence.strip():
+                yield sentence.strip()
+        buffer = parts[-1]
+    if buffer.strip():
+        yield buffer.strip()
@@ -1,218 +1,669 @@
 import json
-import os
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-load_dotenv()
-
-GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GOOGLE_API_KEY:
-    print("[ERROR] GEMINI_API_KEY not found in environment variables")
-
-MODEL = "gemini-2.0-flash"
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CHAT_HISTORY_FILE = os.path.join(BASE_DIR, "chat_history.json")
-
-os.makedirs(os.path.dirname(CHAT_HISTORY_FILE), exist_ok=True)
-
-system_instruction = """ 
-You are a responsive, intelligent, and fluent virtual assistant who communicates in Indonesian. 
-Your task is to provide clear, concise, and informative answers in response to user queries or statements spoken through voice. 
- 
-Your answers must: 
-- Be written in polite and easily understandable Indonesian. 
-- Be short and to the point (maximum 2–3 sentences). 
-- Avoid repeating the user's question; respond directly with the answer. 
- 
-Example tone: 
-User: Cuaca hari ini gimana? 
-Assistant: Hari ini cuacanya cerah di sebagian besar wilayah, dengan suhu sekitar 30 derajat. 
- 
-User: Kamu tahu siapa presiden Indonesia? 
-Assistant: Presiden Indonesia saat ini adalah Joko Widodo. 
- 
-If you're unsure about an answer, be honest and say that you don't know. 
-""" 
-
-try:
-    genai.configure(api_key=GOOGLE_API_KEY)
-    model = genai.GenerativeModel(model_name=MODEL)
-    print(f"[INFO] Successfully configured Gemini API with model: {MODEL}")
-except Exception as e:
-    print(f"[ERROR] Failed to configure Gemini API: {e}")
-    model = None
-
-def save_chat_history(chat):
-    try:
-        # Convert chat history to a serializable format
-        history = []
-        for message in chat.history:
-            history.append({
-                "role": message.role,
-                "parts": [part.text for part in message.parts if hasattr(part, 'text')]
-            })
-        with open(CHAT_HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False)
-        print(f"[INFO] Chat history saved to {CHAT_HISTORY_FILE}")
-    except Exception as e:
-        print(f"[ERROR] Failed to save chat history: {e}")
-
-def load_chat_history():
-    try:
-        if os.path.exists(CHAT_HISTORY_FILE) and os.path.getsize(CHAT_HISTORY_FILE) > 0:
-            with open(CHAT_HISTORY_FILE, "r", encoding="utf-8") as f:
-                history = json.load(f)
-            print(f"[INFO] Chat history loaded from {CHAT_HISTORY_FILE}")
-            return model.start_chat(history=history)
-    except Exception as e:
-        print(f"[ERROR] Failed to load chat history: {e}")
-    
-    print("[INFO] Starting new chat session")
-    return model.start_chat()
-
-try:
-    chat = load_chat_history()
-except Exception as e:
-    print(f"[ERROR] Failed to initialize chat: {e}")
-    chat = None
-
-def generate_response(prompt: str) -> str:
-    if not model or not chat:
-        return "[ERROR] Gemini API not properly initialized"
-        
-    try:
-        print(f"[INFO] Processing user prompt: '{prompt}'")
-        
-        if not chat.history:
-            print("[INFO] Sending system instruction to new chat")
-            chat.send_message(system_instruction)
-        
-        response = chat.send_message(prompt)
-        response_text = response.text.strip()
-        
-        print(f"[INFO] Gemini response: '{response_text}'")
-        save_chat_history(chat)
-        
-        return response_text
-    except Exception as e:
-        print(f"[ERROR] Failed to generate response: {e}")
-        return f"[ERROR] {e}"
-
-from fastapi import FastAPI, UploadFile, File, Request
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, Response, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from app.stt import transcribe_speech_to_text
-from app.llm import generate_response
-from app.tts import transcribe_text_to_speech
+from app.stt import transcribe_speech_to_text, transcribe_record, transcribe_samples, transcribe_partial, error_status, STT_POOL_SIZE
+from app.llm import generate_response, generate_response_stream, iter_sentences, close_client, response_cache, DEFAULT_SESSION_ID
+from app.tts import transcribe_text_to_speech, synthesize_speech, spool_speech_audio, encode_speech_audio, audio_spool, tts_cache, AUDIO_CODECS, TTS_OUTPUT_CODEC, TTS_OPUS_BITRATE, TTS_POOL_SIZE, TTS_MAX_BATCH_SIZE, configure_tts_threads
 import os
-import tempfile
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import logging
-from typing import Optional
+from typing import List, Optional
 import base64
+from urllib.parse import quote
+from app.engines import engine_status, engines_ready, shutdown_engines, warmup_engines_in_background
+from app.log import configure_logging
+from app.single_flight import SingleFlight
+from app.streaming_asr import StreamingRecognizer
+from app.metrics import AUDIO_BYTES, AUDIO_CODEC_BYTES_SAVED, LLM_CACHE_LOOKUPS, STAGE_ERRORS, TTS_CACHE_LOOKUPS, render_metrics, track_stage
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+configure_logging()
 logger = logging.getLogger("voice-assistant")
 
 app = FastAPI(title="Voice AI Assistant API")
 
+# Model dimuat di background setelah server start; set 0 untuk memuat hanya saat request pertama
+ENGINE_WARMUP = os.getenv("ENGINE_WARMUP", "1") == "1"
+
+# Jumlah worker uvicorn (variabel yang juga dibaca uvicorn); core dibagi ke semua proses TTS di node
+SERVER_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+configure_tts_threads(SERVER_WORKERS)
+
+# Upload identik (hash isi + sesi) yang datang bersamaan hanya diproses sekali; hasilnya
+# disimpan sebentar agar retry langsung terjawab. TTL 0 hanya menggabungkan yang bersamaan.
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1"
+SINGLE_FLIGHT_TTL = float(os.getenv("SINGLE_FLIGHT_TTL", "15"))
+SINGLE_FLIGHT_MAX_ENTRIES = int(os.getenv("SINGLE_FLIGHT_MAX_ENTRIES", "64"))
+
+# Executor terpisah per tahap agar panggilan blocking tidak menahan event loop.
+# STT dan TTS sendiri berjalan di proses engine, thread di sini hanya menunggu hasilnya.
+# Gemini dipanggil lewat client async sehingga tidak butuh executor.
+STT_EXECUTOR_WORKERS = int(os.getenv("STT_EXECUTOR_WORKERS", str(STT_POOL_SIZE)))
+# Thread TTS cukup untuk mengisi batch penuh di setiap worker
+TTS_EXECUTOR_WORKERS = int(os.getenv("TTS_EXECUTOR_WORKERS", str(TTS_POOL_SIZE * TTS_MAX_BATCH_SIZE)))
+
+stt_executor = ThreadPoolExecutor(max_workers=STT_EXECUTOR_WORKERS, thread_name_prefix="stt")
+tts_executor = ThreadPoolExecutor(max_workers=TTS_EXECUTOR_WORKERS, thread_name_prefix="tts")
+
+single_flight = SingleFlight(SINGLE_FLIGHT_TTL, SINGLE_FLIGHT_MAX_ENTRIES, SINGLE_FLIGHT_ENABLED)
+
+async def run_in_stage(executor, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Transcript", "X-Response-Text", "X-Session-Id", "X-Audio-Seconds", "X-Speech-Seconds", "X-LLM-Cache", "X-Audio-Id", "X-STT-Tier", "X-Audio-Codec", "X-Audio-Bytes-Saved", "X-Single-Flight"],
 )
 
+@app.on_event("startup")
+def load_engines():
+    # Server langsung menerima koneksi; /readyz baru 200 setelah semua engine hangat
+    audio_spool.start()
+    if ENGINE_WARMUP:
+        warmup_engines_in_background()
+
+@app.on_event("shutdown")
+async def unload_engines():
+    for executor in (stt_executor, tts_executor):
+        executor.shutdown(wait=False, cancel_futures=True)
+    await close_client()
+    shutdown_engines()
+    audio_spool.stop()
+
 @app.get("/")
 def read_root():
     return {"message": "Voice AI Assistant API is running"}
 
+@app.get("/healthz")
+def healthz():
+    # Liveness: proses hidup dan event loop merespons
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    # Readiness: semua engine sudah dimuat dan di-warmup
+    ready = engines_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "warming_up", "engines": engine_status()},
+    )
+
+@app.get("/metrics")
+def metrics():
+    cache_stats = tts_cache.stats()
+    for result in ("memory_hits", "disk_hits", "misses"):
+        TTS_CACHE_LOOKUPS.set_total(cache_stats[result], result=result)
+    llm_cache_stats = response_cache.stats()
+    for result in ("hits", "misses"):
+        LLM_CACHE_LOOKUPS.set_total(llm_cache_stats[result], result=result)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/tts/cache")
+def tts_cache_stats():
+    return tts_cache.stats()
+
+@app.get("/llm/cache")
+def llm_cache_stats():
+    return response_cache.stats()
+
+@app.get("/single-flight")
+def single_flight_stats():
+    return single_flight.stats()
+
+@app.get("/audio/spool")
+def audio_spool_stats():
+    return audio_spool.stats()
+
+@app.get("/audio/{audio_id}")
+def get_spooled_audio(audio_id: str):
+    """Ambil ulang audio balasan selama belum kedaluwarsa (lihat AUDIO_SPOOL_TTL)."""
+    audio = audio_spool.get(audio_id)
+    if audio is None:
+        return JSONResponse(status_code=404, content={"error": "Audio not found or expired"})
+    if audio.in_memory:
+        return Response(content=audio.data, media_type="audio/wav")
+    return FileResponse(audio.path, media_type="audio/wav", filename="response.wav")
+
+def _negotiate_output(request: Request, response_format: Optional[str], audio_format: Optional[str] = None):
+    """
+    Tentukan (binary, codec): audio langsung di body atau di dalam JSON, dan codec-nya.
+    response_format "wav"/"opus" atau header Accept audio/wav, audio/ogg memilih body audio;
+    untuk JSON dan streaming codec dipilih lewat audio_format (default TTS_OUTPUT_CODEC).
+    """
+    response_format = (response_format or request.query_params.get("response_format") or "").lower()
+    if response_format in AUDIO_CODECS:
+        return True, response_format
+    if not response_format:
+        accept = request.headers.get("accept", "").lower()
+        if "audio/ogg" in accept or "audio/opus" in accept:
+            return True, "opus"
+        if "audio/wav" in accept:
+            return True, "wav"
+    return False, _output_codec(audio_format or request.query_params.get("audio_format"))
+
+def _output_codec(audio_format: Optional[str]) -> str:
+    audio_format = (audio_format or "").lower()
+    return audio_format if audio_format in AUDIO_CODECS else TTS_OUTPUT_CODEC
+
+async def _encode_reply_audio(audio_bytes: bytes, codec: str, timings: Optional[dict] = None):
+    """Kompres audio balasan ke `codec`; mengembalikan (bytes, info codec untuk response)."""
+    if codec == "wav":
+        return audio_bytes, {"codec": "wav", "bytes": len(audio_bytes)}
+    encode_timings = {}
+    try:
+        with track_stage("audio_codec", encode_timings):
+            encoded = await run_in_stage(None, encode_speech_audio, audio_bytes, codec)
+    except Exception as e:
+        # Lebih baik tetap mengirim WAV daripada gagal total
+        logger.warning("Failed to encode reply audio as %s, sending WAV: %s", codec, e)
+        return audio_bytes, {"codec": "wav", "bytes": len(audio_bytes)}
+    saved = len(audio_bytes) - len(encoded)
+    AUDIO_CODEC_BYTES_SAVED.inc(max(0, saved), codec=codec)
+    if timings is not None:
+        timings.update(encode_timings)
+    return encoded, {
+        "codec": codec,
+        "bitrate": TTS_OPUS_BITRATE,
+        "pcm_bytes": len(audio_bytes),
+        "bytes": len(encoded),
+        "bytes_saved": saved,
+        "encode_ms": encode_timings["audio_codec_ms"],
+    }
+
+def _use_response_cache(request: Request, no_cache: Optional[bool]) -> bool:
+    # Cache balasan dilewati bila form no_cache=true atau header Cache-Control: no-cache/no-store
+    if no_cache:
+        return False
+    cache_control = request.headers.get("cache-control", "").lower()
+    return "no-cache" not in cache_control and "no-store" not in cache_control
+
+def _server_timing(timings: dict) -> str:
+    # Format header Server-Timing, misalnya "stt;dur=812.5, llm;dur=640.1"
+    return ", ".join(f"{name[:-len('_ms')]};dur={value}" for name, value in timings.items())
+
+async def _voice_chat_pipeline(contents: bytes, extension: str, session_id: str, use_cache: bool) -> dict:
+    """
+    STT -> Gemini -> TTS untuk satu upload. Hasilnya (atau dict dengan key "error")
+    dipakai bersama oleh request identik lewat single_flight.
+    """
+    timings = {}
+    stt_info = {}
+    with track_stage("stt", timings):
+        transcript = await run_in_stage(
+            stt_executor, transcribe_speech_to_text, contents, extension, stt_info
+        )
+    if transcript.startswith("[ERROR]"):
+        STAGE_ERRORS.inc(stage="stt")
+        logger.error("STT error: %s", transcript)
+        return {"error": transcript, "transcript": transcript, "response_text": ""}
+    logger.debug("Transcribed: %s", transcript)
+    
+    llm_info = {}
+    with track_stage("llm", timings):
+        response_text = await generate_response(transcript, session_id, llm_info, use_cache)
+    if response_text.startswith("[ERROR]"):
+        STAGE_ERRORS.inc(stage="llm")
+        logger.error("LLM error: %s", response_text)
+        return {"error": response_text, "transcript": transcript, "response_text": response_text}
+    logger.debug("LLM Response: %s", response_text)
+    
+    cache_key = llm_info.pop("cache_key", None)
+    cached_audio = response_cache.get_audio(cache_key) if llm_info.get("cache") == "hit" else None
+    if cached_audio is not None:
+        # Balasan dari cache sudah membawa audionya, TTS dilewati
+        audio_id = await run_in_stage(None, spool_speech_audio, cached_audio)
+    else:
+        with track_stage("tts", timings):
+            audio_id = await run_in_stage(tts_executor, transcribe_text_to_speech, response_text)
+    if not audio_id or audio_id.startswith("[ERROR]"):
+        STAGE_ERRORS.inc(stage="tts")
+        logger.error("TTS error: %s", audio_id)
+        return {"error": f"Failed to generate speech: {audio_id}", "transcript": transcript, "response_text": response_text}
+    
+    if cache_key is not None and cached_audio is None:
+        audio = audio_spool.get(audio_id)
+        if audio is not None:
+            response_cache.attach_audio(cache_key, audio.data if audio.in_memory else await run_in_stage(None, audio.read))
+    return {
+        "transcript": transcript,
+        "response_text": response_text,
+        "audio_id": audio_id,
+        "stt": stt_info,
+        "llm": llm_info,
+        "timings": timings,
+    }
+
 @app.post("/voice-chat")
-async def voice_chat(request: Request, file: UploadFile = File(...)):
+async def voice_chat(
+    request: Request,
+    file: UploadFile = File(...),
+    session_id: Optional[str] = Form(None),
+    response_format: Optional[str] = Form(None),
+    audio_format: Optional[str] = Form(None),
+    no_cache: Optional[bool] = Form(None),
+):
     """
     Process voice chat workflow:
-    1. Receive audio file from frontend
+    1. Receive audio file (and optional session id) from frontend
     2. Convert speech to text using Whisper
     3. Generate response using Gemini
     4. Convert response to speech
     5. Return audio file, transcript, and response text
+
+    Response format: "json" (default, audio base64 di dalam JSON), "wav" atau
+    "opus" (body berisi audio langsung, transcript dan response text di header
+    X-Transcript / X-Response-Text yang di-URL-encode). Body audio juga dipilih
+    bila header Accept berisi audio/wav atau audio/ogg. Pada mode JSON codec
+    audio dipilih dengan audio_format ("wav" atau "opus").
+
+    Pertanyaan yang sama pada konteks percakapan yang sama dijawab dari cache
+    (teks dan audio) tanpa Gemini maupun TTS; kirim no_cache=true atau header
+    Cache-Control: no-cache untuk melewatinya.
+
+    Upload yang byte-identik untuk sesi yang sama (retry, klik ganda) tidak diproses
+    ulang: request yang datang selagi yang pertama berjalan menunggu hasilnya, dan
+    retry dalam SINGLE_FLIGHT_TTL detik dijawab dari memori (field single_flight).
+
+    Upload yang tidak bisa di-decode dibalas 400 dan audio tanpa ucapan 422;
+    kegagalan engine (Whisper, Gemini, TTS) tetap 500.
     """
-    logger.info(f"Received request from {request.client.host} with file: {file.filename}")
-    logger.info(f"Request headers: {request.headers}")
+    # Session id boleh dikirim lewat form field atau header X-Session-Id
+    session_id = session_id or request.headers.get("X-Session-Id") or DEFAULT_SESSION_ID
+    logger.debug("voice-chat request client=%s file=%s session=%s", request.client.host, file.filename, session_id)
     
-    contents = await file.read()
-    file_size = len(contents)
-    logger.info(f"File received: {file_size} bytes")
+    timings = {}
+    with track_stage("upload_read", timings):
+        contents = await file.read()
+    AUDIO_BYTES.inc(len(contents), direction="input")
     
-    if not contents or file_size == 0:
-        logger.error("Empty file received")
+    if not contents:
+        logger.warning("Empty file received")
         return JSONResponse(
             status_code=400,
             content={"error": "Empty file", "transcript": "", "response_text": ""}
         )
     
-    temp_dir = tempfile.mkdtemp()
-    logger.info(f"Created temporary directory: {temp_dir}")
-    
-    logger.info("Starting speech-to-text processing")
-    transcript = transcribe_speech_to_text(contents, file_ext=os.path.splitext(file.filename)[1])
-    if transcript.startswith("[ERROR]"):
-        logger.error(f"STT error: {transcript}")
-        return JSONResponse(
-            status_code=500,
-            content={"error": transcript, "transcript": transcript, "response_text": ""}
-        )
-    
-    logger.info(f"Transcribed: {transcript}")
-    
-    logger.info("Generating LLM response")
-    response_text = generate_response(transcript)
-    if response_text.startswith("[ERROR]"):
-        logger.error(f"LLM error: {response_text}")
-        return JSONResponse(
-            status_code=500,
-            content={"error": response_text, "transcript": transcript, "response_text": response_text}
-        )
-    
-    logger.info(f"LLM Response: {response_text}")
+    use_cache = _use_response_cache(request, no_cache)
+    extension = os.path.splitext(file.filename)[1]
+    flight_key = single_flight.key("voice-chat", session_id, extension, use_cache, contents)
+    result, flight = await single_flight.run(
+        flight_key, lambda: _voice_chat_pipeline(contents, extension, session_id, use_cache),
+        reuse_recent=use_cache, keep=lambda result: "error" not in result,
+    )
+    if "error" in result:
+        return JSONResponse(status_code=error_status(result["error"]), content=result)
+    if flight != "executed":
+        logger.info("voice-chat session=%s answered by %s single-flight run", session_id, flight)
+    transcript, response_text, audio_id = result["transcript"], result["response_text"], result["audio_id"]
+    stt_info, llm_info = result["stt"], result["llm"]
+    timings.update(result["timings"])
     
-    logger.info("Starting text-to-speech processing")
-    audio_path = transcribe_text_to_speech(response_text)
-    if not audio_path or audio_path.startswith("[ERROR]"):
-        logger.error(f"TTS error: {audio_path}")
-        return JSONResponse(
-            status_code=500,
-            content={"error": f"Failed to generate speech: {audio_path}", "transcript": transcript, "response_text": response_text}
-        )
-    
-    if not os.path.exists(audio_path):
-        logger.error(f"Audio file not found at: {audio_path}")
+    audio = audio_spool.get(audio_id)
+    if audio is None:
+        STAGE_ERRORS.inc(stage="tts")
+        logger.error("Spooled audio not found: %s", audio_id)
         return JSONResponse(
             status_code=500, 
-            content={"error": f"Audio file not found at: {audio_path}", "transcript": transcript, "response_text": response_text}
+            content={"error": f"Audio not found: {audio_id}", "transcript": transcript, "response_text": response_text}
         )
     
-    file_size = os.path.getsize(audio_path)
-    logger.info(f"Audio file saved at: {audio_path} ({file_size} bytes)")
+    binary, codec = _negotiate_output(request, response_format, audio_format)
+    audio_bytes = audio.data
+    if audio_bytes is None and (codec != "wav" or not binary):
+        audio_bytes = await run_in_stage(None, audio.read)
+    codec_info = {"codec": "wav", "bytes": audio.size}
+    if codec != "wav":
+        audio_bytes, codec_info = await _encode_reply_audio(audio_bytes, codec, timings)
+        codec = codec_info["codec"]
+    AUDIO_BYTES.inc(codec_info["bytes"], direction="output")
+    media_type, extension = AUDIO_CODECS[codec]
+    filename = f"response.{extension}"
+    logger.info(
+        "voice-chat done session=%s audio_seconds=%s speech_seconds=%s codec=%s timings=%s",
+        session_id, stt_info.get("audio_seconds"), stt_info.get("speech_seconds"), codec, timings,
+    )
+    
+    if binary:
+        # Kirim byte audio apa adanya tanpa base64; audio kecil langsung dari memori
+        headers = {
+            "X-Transcript": quote(transcript),
+            "X-Response-Text": quote(response_text),
+            "X-Session-Id": quote(session_id),
+            "X-Audio-Id": audio.id,
+            "X-Audio-Seconds": str(stt_info.get("audio_seconds", "")),
+            "X-Speech-Seconds": str(stt_info.get("speech_seconds", "")),
+            "X-STT-Tier": stt_info.get("tier", ""),
+            "X-LLM-Cache": llm_info.get("cache", ""),
+            "X-Single-Flight": flight,
+            "X-Audio-Codec": codec,
+            "X-Audio-Bytes-Saved": str(codec_info.get("bytes_saved", 0)),
+            "Server-Timing": _server_timing(timings),
+        }
+        if audio_bytes is None:
+            # WAV besar yang di-spill ke disk dikirim langsung dari file
+            return FileResponse(audio.path, media_type=media_type, filename=filename, headers=headers)
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return Response(content=audio_bytes, media_type=media_type, headers=headers)
     
-    # Baca file audio dan konversi ke base64 agar bisa dikirim dalam JSON
-    with open(audio_path, "rb") as audio_file:
-        audio_data = base64.b64encode(audio_file.read()).decode("utf-8")
+    # Konversi audio ke base64 agar bisa dikirim dalam JSON
+    with track_stage("audio_encode", timings):
+        audio_data = base64.b64encode(audio_bytes).decode("utf-8")
     
-    logger.info(f"Sending response with audio, transcript, and response text")
     return {
         "audio": audio_data,
-        "audio_filename": "response.wav",
+        "audio_id": audio.id,
+        "audio_filename": filename,
+        "audio_format": codec,
+        "audio_codec": codec_info,
         "transcript": transcript,
-        "response_text": response_text
+        "response_text": response_text,
+        "session_id": session_id,
+        "stt": stt_info,
+        "llm": llm_info,
+        "single_flight": flight,
+        "timings": timings
     }
     
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _synthesize_tracked(sentence: str, codec: str = "wav"):
+    # Kompresi ikut berjalan di task yang sama, tumpang tindih dengan kalimat berikutnya
+    with track_stage("tts"):
+        audio_bytes = await run_in_stage(tts_executor, synthesize_speech, sentence)
+    return await _encode_reply_audio(audio_bytes, codec)
+
+async def _voice_reply_events(transcript: str, session_id: str, stt_info: dict, use_cache: bool = True,
+                              codec: str = "wav"):
+    """
+    Alirkan balasan per kalimat sebagai pasangan (event, data): stream token Gemini dipotong
+    per kalimat, setiap kalimat langsung disintesis, dan audionya dikirim sesuai urutan begitu siap.
+    """
+    yield "transcript", {"transcript": transcript, "session_id": session_id, "stt": stt_info}
+
+    pending = asyncio.Queue()
+    llm_info = {}
+
+    async def produce_sentences():
+        reply = generate_response_stream(transcript, session_id, llm_info, use_cache)
+        sentences = iter_sentences(reply)
+        try:
+            with track_stage("llm"):
+                async for sentence in sentences:
+                    # TTS kalimat ini mulai berjalan sementara Gemini melanjutkan kalimat berikutnya
+                    tts_task = asyncio.ensure_future(_synthesize_tracked(sentence, codec))
+                    pending.put_nowait((sentence, tts_task))
+        except asyncio.TimeoutError:
+            pending.put_nowait(RuntimeError("Gemini did not answer in time"))
+        except Exception as e:
+            pending.put_nowait(e)
+        finally:
+            # Tutup generator agar lock sesi dilepas walaupun client putus di tengah jalan
+            await sentences.aclose()
+            await reply.aclose()
+            pending.put_nowait(None)
+
+    producer = asyncio.ensure_future(produce_sentences())
+    response_parts = []
+    codec_totals = {"codec": codec, "bytes": 0, "bytes_saved": 0}
+    try:
+        index = 0
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                logger.error("LLM stream error: %s", item)
+                yield "error", {"error": f"[ERROR] {item}"}
+                return
+            sentence, tts_task = item
+            try:
+                audio_bytes, codec_info = await tts_task
+            except Exception as e:
+                logger.error("TTS error: %s", e)
+                yield "error", {"error": f"Failed to generate speech: {e}"}
+                return
+            response_parts.append(sentence)
+            AUDIO_BYTES.inc(len(audio_bytes), direction="output")
+            codec_totals["bytes"] += len(audio_bytes)
+            codec_totals["bytes_saved"] += codec_info.get("bytes_saved", 0)
+            with track_stage("audio_encode"):
+                audio_data = base64.b64encode(audio_bytes).decode("utf-8")
+            yield "audio", {"index": index, "text": sentence, "audio": audio_data, "format": codec_info["codec"]}
+            index += 1
+
+        llm_info.pop("cache_key", None)
+        yield "done", {
+            "response_text": " ".join(response_parts), "session_id": session_id, "llm": llm_info, "audio_codec": codec_totals,
+        }
+    finally:
+        # Client putus atau terjadi error: hentikan stream Gemini yang masih berjalan
+        producer.cancel()
+
+async def _voice_stream_events(contents: bytes, extension: str, session_id: str, use_cache: bool, codec: str):
+    """
+    STT lalu balasan per kalimat sebagai pasangan (event, data) untuk /voice-chat/stream.
+    Event pertama "error" berarti STT gagal.
+    """
+    stt_info = {}
+    with track_stage("stt"):
+        transcript = await run_in_stage(stt_executor, transcribe_speech_to_text, contents, extension, stt_info)
+    if transcript.startswith("[ERROR]"):
+        STAGE_ERRORS.inc(stage="stt")
+        logger.error("STT error: %s", transcript)
+        yield "error", {"error": transcript, "transcript": transcript, "response_text": ""}
+        return
+
+    events = _voice_reply_events(transcript, session_id, stt_info, use_cache, codec)
+    try:
+        async for item in events:
+            yield item
+    finally:
+        await events.aclose()
+
+async def _stream_voice_reply(first: tuple, events):
+    try:
+        yield _sse_event(*first)
+        async for event, data in events:
+            yield _sse_event(event, data)
+    finally:
+        await events.aclose()
+
+@app.post("/voice-chat/stream")
+async def voice_chat_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    session_id: Optional[str] = Form(None),
+    audio_format: Optional[str] = Form(None),
+    no_cache: Optional[bool] = Form(None),
+):
+    """
+    Versi streaming /voice-chat (Server-Sent Events). Urutan event:
+    transcript -> audio (satu per kalimat, base64 dengan codec audio_format) -> done, atau error.
+    Upload identik digabung seperti /voice-chat: request duplikat menerima event yang sama.
+    """
+    session_id = session_id or request.headers.get("X-Session-Id") or DEFAULT_SESSION_ID
+
+    with track_stage("upload_read"):
+        contents = await file.read()
+    AUDIO_BYTES.inc(len(contents), direction="input")
+    if not contents:
+        logger.warning("Empty file received")
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Empty file", "transcript": "", "response_text": ""}
+        )
+
+    use_cache = _use_response_cache(request, no_cache)
+    codec = _output_codec(audio_format or request.query_params.get("audio_format"))
+    extension = os.path.splitext(file.filename)[1]
+    flight_key = single_flight.key("voice-chat/stream", session_id, extension, use_cache, codec, contents)
+    events, flight = single_flight.stream(
+        flight_key, lambda: _voice_stream_events(contents, extension, session_id, use_cache, codec),
+        reuse_recent=use_cache, keep=lambda events: bool(events) and events[-1][0] == "done",
+    )
+    try:
+        # Tunggu hasil STT dulu agar transkrip yang gagal tetap dibalas dengan kode HTTP error
+        first = await events.__anext__()
+        if first[0] == "error":
+            await events.aclose()
+            return JSONResponse(status_code=error_status(first[1]["error"]), content=first[1])
+        if flight != "executed":
+            logger.info("voice-chat/stream session=%s answered by %s single-flight run", session_id, flight)
+        return StreamingResponse(
+            _stream_voice_reply(first, events),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Single-Flight": flight},
+        )
+    except BaseException:
+        # Client putus saat menunggu STT atau error sebelum response dibuat
+        await events.aclose()
+        raise
+
+async def _final_transcript(samples, stt_info: dict) -> str:
+    with track_stage("stt"):
+        return await run_in_stage(stt_executor, transcribe_samples, samples, stt_info)
+
+@app.websocket("/voice-chat/ws")
+async def voice_chat_ws(
+    websocket: WebSocket,
+    session_id: Optional[str] = None,
+    sample_rate: int = 16000,
+    audio_format: Optional[str] = None,
+    no_cache: bool = False,
+):
+    """
+    Voice chat dengan ASR streaming. Client mengirim frame biner PCM 16-bit mono
+    (`sample_rate`, default 16000) selagi merekam, dan boleh mengirim {"type": "end"}
+    untuk menutup ucapan secara manual ("end" tanpa bunyi sejak ucapan terakhir diabaikan). Audio balasan memakai codec `audio_format`
+    ("wav" atau "opus", default TTS_OUTPUT_CODEC). Server mengirim JSON:
+    partial (transkrip sementara) -> transcript -> audio (per kalimat) -> done, atau error.
+    Begitu endpointing mendeteksi akhir ucapan, transkrip final langsung dikirim ke LLM;
+    satu koneksi bisa dipakai untuk banyak giliran.
+    """
+    await websocket.accept()
+    session_id = session_id or DEFAULT_SESSION_ID
+    codec = _output_codec(audio_format)
+    recognizer = StreamingRecognizer(sample_rate)
+    send_lock = asyncio.Lock()
+    tasks = set()
+    partial_task = None
+    speculative = None  # (akhir ucapan yang di-decode, task transkrip final, info STT)
+    reply_task = None
+
+    async def send(message: dict):
+        async with send_lock:
+            await websocket.send_json(message)
+
+    def spawn(coro) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return task
+
+    async def send_partial(utterance_id: int, samples):
+        with track_stage("stt_partial"):
+            text = await run_in_stage(stt_executor, transcribe_partial, samples)
+        # Transkrip sementara yang datang setelah ucapannya selesai tidak perlu dikirim
+        if not text.startswith("[ERROR]") and utterance_id == recognizer.utterance_id:
+            await send({"type": "partial", "utterance": utterance_id, "text": text})
+
+    def start_final():
+        # Decode final untuk ucapan sampai frame bersuara terakhir saat ini
+        stt_info = {}
+        samples = recognizer.utterance(stt_info)
+        return recognizer.speech_end, spawn(_final_transcript(samples, stt_info)), stt_info
+
+    async def reply(utterance_id: int, transcript_task, stt_info: dict, previous):
+        if previous is not None:
+            # Giliran sebelumnya di koneksi ini harus selesai dulu
+            await asyncio.gather(previous, return_exceptions=True)
+        transcript = await transcript_task
+        if transcript.startswith("[ERROR]"):
+            STAGE_ERRORS.inc(stage="stt")
+            await send({"type": "error", "utterance": utterance_id, "error": transcript})
+            return
+        events = _voice_reply_events(transcript, session_id, stt_info, not no_cache, codec)
+        try:
+            async for event, data in events:
+                await send({"type": event, "utterance": utterance_id, **data})
+        finally:
+            await events.aclose()
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                AUDIO_BYTES.inc(len(message["bytes"]), direction="input")
+                recognizer.feed(message["bytes"])
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    control = {}
+                if control.get("type") == "end":
+                    recognizer.end()
+
+            if recognizer.partial_due and (partial_task is None or partial_task.done()):
+                partial_task = spawn(send_partial(recognizer.utterance_id, recognizer.partial_window()))
+
+            # Mulai decode final saat jeda pendek; bila ucapan benar-benar berakhir hasilnya sudah siap
+            if recognizer.pause_detected and (speculative is None or speculative[0] != recognizer.speech_end):
+                speculative = start_final()
+
+            if recognizer.endpoint:
+                if not recognizer.started:
+                    await send({"type": "error", "utterance": recognizer.utterance_id, "error": "[ERROR] No speech detected"})
+                else:
+                    if speculative is None or speculative[0] != recognizer.speech_end:
+                        speculative = start_final()
+                    _, transcript_task, stt_info = speculative
+                    reply_task = spawn(reply(recognizer.utterance_id, transcript_task, stt_info, reply_task))
+                speculative = None
+                recognizer.reset()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in list(tasks):
+            task.cancel()
+
+async def _transcribe_upload(filename: str, contents: bytes) -> dict:
+    with track_stage("stt"):
+        record = await run_in_stage(stt_executor, transcribe_record, filename, contents)
+    if "error" in record:
+        STAGE_ERRORS.inc(stage="stt")
+    return record
+
+async def _stream_transcripts(uploads: list):
+    # Semua file diantrikan ke executor STT; hasil dikirim sesuai urutan selesai
+    for task in asyncio.as_completed([_transcribe_upload(filename, contents) for filename, contents in uploads]):
+        record = await task
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+@app.post("/transcribe")
+async def transcribe(files: List[UploadFile] = File(...)):
+    """
+    Transkripsi banyak file sekaligus tanpa LLM/TTS. Hasil dialirkan sebagai JSONL,
+    satu baris per file begitu file tersebut selesai: {"file", "text" atau "error", ...}.
+    """
+    # File form sudah ditutup FastAPI sebelum body streaming berjalan, jadi isinya dibaca di sini
+    uploads = []
+    with track_stage("upload_read"):
+        for upload in files:
+            contents = await upload.read()
+            AUDIO_BYTES.inc(len(contents), direction="input")
+            uploads.append((upload.filename, contents))
+    return StreamingResponse(_stream_transcripts(uploads), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Lebih dari satu worker butuh import string agar setiap proses memuat aplikasinya sendiri
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, workers=SERVER_WORKERS)
\ No newline at end of file
@@ -0,0 +1,199 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, "", value) for key, value in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels):
+        # Untuk mencerminkan counter yang sudah dihitung di tempat lain (misalnya cache TTS)
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            state["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            state["sum"] += value
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, state in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), state["counts"]):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", key, f'le="{_format_value(bound)}"', cumulative))
+                samples.append((f"{self.name}_sum", key, "", state["sum"]))
+                samples.append((f"{self.name}_count", key, "", cumulative))
+        return samples
+
+
+REGISTRY = []
+
+
+def render_metrics() -> str:
+    """Semua metrik dalam format teks Prometheus (text/plain; version=0.0.4)."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+STAGE_LATENCY = Histogram(
+    "voice_stage_latency_seconds",
+    "Latency of each voice pipeline stage",
+    ("stage",),
+)
+STAGE_IN_FLIGHT = Gauge(
+    "voice_stage_in_flight",
+    "Requests currently inside each voice pipeline stage",
+    ("stage",),
+)
+STAGE_ERRORS = Counter(
+    "voice_stage_errors_total",
+    "Errors raised or reported by each voice pipeline stage",
+    ("stage",),
+)
+AUDIO_BYTES = Counter(
+    "voice_audio_bytes_total",
+    "Audio bytes received from clients (input) and sent back (output)",
+    ("direction",),
+)
+TTS_CACHE_LOOKUPS = Counter(
+    "voice_tts_cache_lookups_total",
+    "TTS cache lookups since start, by result",
+    ("result",),
+)
+LLM_CACHE_LOOKUPS = Counter(
+    "voice_llm_cache_lookups_total",
+    "LLM response cache lookups since start, by result",
+    ("result",),
+)
+LLM_RETRIES = Counter(
+    "voice_llm_retries_total",
+    "Gemini calls retried after a transient error",
+)
+LLM_HEDGED = Counter(
+    "voice_llm_hedged_total",
+    "Duplicate Gemini requests sent because the first one was slow",
+)
+AUDIO_CODEC_BYTES_SAVED = Counter(
+    "voice_audio_codec_bytes_saved_total",
+    "Output bytes saved by compressing TTS audio instead of sending PCM WAV",
+    ("codec",),
+)
+STT_TIER_DECODES = Counter(
+    "voice_stt_tier_decodes_total",
+    "Whisper decodes per model tier, including fast-tier attempts that were escalated",
+    ("tier",),
+)
+STT_ESCALATIONS = Counter(
+    "voice_stt_escalations_total",
+    "Fast-tier transcripts re-decoded with a larger model, by tier and reason",
+    ("tier", "reason"),
+)
+SINGLE_FLIGHT_REQUESTS = Counter(
+    "voice_single_flight_requests_total",
+    "Voice requests that ran the pipeline, joined an identical in-flight run, or reused a recent result",
+    ("result",),
+)
+TTS_BATCH_OCCUPANCY = Histogram(
+    "voice_tts_batch_occupancy",
+    "Fraction of the maximum TTS batch size filled per batched inference",
+    buckets=(0.125, 0.25, 0.375, 0.5, 0.625, 0.75, 0.875, 1.0),
+)
+
+
+@contextmanager
+def track_stage(stage: str, timings: Optional[dict] = None):
+    """
+    Ukur satu tahap pipeline: latensi ke histogram, jumlah request yang sedang
+    berjalan, dan error bila terjadi exception. Durasi juga dicatat ke `timings`
+    (dalam ms) bila diberikan.
+    """
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_IN_FLIGHT.dec(stage=stage)
+        STAGE_LATENCY.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[f"{stage}_ms"] = round(elapsed * 1000, 2)
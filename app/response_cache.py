@@ -0,0 +1,90 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Semua yang bukan huruf/angka dianggap pemisah, jadi "Cuaca hari ini gimana?" == "cuaca hari ini, gimana"
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+
+
+def normalize_query(text: str) -> str:
+    return NON_WORD_PATTERN.sub(" ", text.casefold()).strip()
+
+
+class ResponseCache:
+    """
+    Cache balasan LLM di memori dengan TTL dan batas LRU. Kunci dibentuk dari
+    transcript yang dinormalisasi ditambah sidik jari konteks percakapan, sehingga
+    pertanyaan yang sama pada konteks yang sama tidak perlu dikirim ulang ke Gemini.
+    Setiap entri menyimpan pesan giliran (untuk riwayat sesi) dan audio TTS bila ada.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, namespace: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def key(self, prompt: str, context: list) -> str:
+        payload = json.dumps([self.namespace, normalize_query(prompt), context], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, response_text: str, messages: list):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = {
+                "response_text": response_text,
+                "messages": messages,
+                "audio": None,
+                "expires_at": time.monotonic() + self.ttl,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_audio(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["audio"] if entry is not None else None
+
+    def attach_audio(self, key: str, audio: bytes):
+        """Simpan audio TTS balasan agar hit berikutnya juga melewati TTS."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["audio"] = audio
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "entries_with_audio": sum(1 for entry in self._entries.values() if entry["audio"] is not None),
+            }
@@ -0,0 +1,114 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class SessionStore:
+    """Riwayat percakapan per sesi di SQLite (mode WAL); setiap giliran cukup satu append."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                parts TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id)")
+        # Ringkasan berjalan: message_count = jumlah pesan awal yang sudah terangkum
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                session_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                message_count INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Satu koneksi per thread; WAL membuat pembaca tidak terblokir oleh penulis
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _rows(session_id: str, messages: list) -> list:
+        now = time.time()
+        return [
+            (session_id, message["role"], json.dumps(message["parts"], ensure_ascii=False), now)
+            for message in messages
+        ]
+
+    def append(self, session_id: str, messages: list):
+        """Tambahkan pesan baru ke akhir riwayat sesi dalam satu transaksi."""
+        if not messages:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, parts, created_at) VALUES (?, ?, ?, ?)",
+                self._rows(session_id, messages),
+            )
+
+    def append_if_empty(self, session_id: str, messages: list) -> bool:
+        """
+        Isi riwayat sesi yang masih kosong (migrasi data lama). Cek dan insert berada dalam
+        satu transaksi IMMEDIATE, jadi bila beberapa proses mencoba bersamaan hanya satu yang menulis.
+        """
+        if not messages:
+            return False
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT 1 FROM messages WHERE session_id = ? LIMIT 1", (session_id,)).fetchone()
+            if row is None:
+                conn.executemany(
+                    "INSERT INTO messages (session_id, role, parts, created_at) VALUES (?, ?, ?, ?)",
+                    self._rows(session_id, messages),
+                )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return row is None
+
+    def load(self, session_id: str, offset: int = 0) -> list:
+        """Riwayat sesi berurutan; `offset` melewati pesan awal yang sudah dimiliki pemanggil."""
+        conn = self._connect()
+        cursor = conn.execute(
+            "SELECT role, parts FROM messages WHERE session_id = ? ORDER BY id LIMIT -1 OFFSET ?",
+            (session_id, offset),
+        )
+        return [{"role": role, "parts": json.loads(parts)} for role, parts in cursor]
+
+    def save_summary(self, session_id: str, summary: str, message_count: int):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries (session_id, summary, message_count, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, summary, message_count, time.time()),
+            )
+
+    def load_summary(self, session_id: str):
+        """Kembalikan (ringkasan, jumlah pesan terangkum), atau ("", 0) bila belum ada."""
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT summary, message_count FROM summaries WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        return (row[0], row[1]) if row else ("", 0)
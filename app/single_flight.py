@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable
+
+from app.metrics import SINGLE_FLIGHT_REQUESTS
+
+
+class _EventLog:
+    """Event dari satu eksekusi stream; setiap pelanggan memutar ulang dari awal lalu mengikuti event baru."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def append(self, item):
+        self.events.append(item)
+        self._notify()
+
+    def finish(self):
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def replay(self):
+        index = 0
+        while True:
+            changed = self._changed
+            if index < len(self.events):
+                yield self.events[index]
+                index += 1
+            elif self.done:
+                return
+            else:
+                await changed.wait()
+
+
+class SingleFlight:
+    """
+    Penggabungan request identik per proses. Request dengan kunci yang sama selagi
+    eksekusi pertama masih berjalan ikut menunggu hasil eksekusi itu alih-alih menjalankan
+    pipeline lagi; hasil yang berhasil disimpan `ttl` detik (maksimal `max_entries`)
+    sehingga retry langsung dijawab dari memori. Hanya dipakai dari event loop.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, enabled: bool = True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._inflight = {}
+        self._recent = OrderedDict()
+        self.executed = 0
+        self.joined = 0
+        self.recent_hits = 0
+
+    @staticmethod
+    def key(*parts) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+            # Panjang setiap bagian ikut di-hash agar batas antar bagian tidak ambigu
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def _get_recent(self, key: str):
+        entry = self._recent.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._recent[key]
+            return None
+        return result
+
+    def _remember(self, key: str, result):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        self._recent[key] = (time.monotonic() + self.ttl, result)
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+
+    def _count(self, role: str):
+        if role == "executed":
+            self.executed += 1
+        elif role == "joined":
+            self.joined += 1
+        else:
+            self.recent_hits += 1
+        SINGLE_FLIGHT_REQUESTS.inc(result=role)
+
+    async def run(self, key: str, func: Callable[[], Awaitable], reuse_recent: bool = True,
+                  keep: Callable = lambda result: True):
+        """
+        Jalankan `func()` sekali untuk semua pemanggil dengan `key` yang sama.
+        Returns:
+            tuple: (hasil, peran) dengan peran "executed", "joined", atau "recent".
+        """
+        if not self.enabled:
+            return await func(), "executed"
+        if reuse_recent:
+            result = self._get_recent(key)
+            if result is not None:
+                self._count("recent")
+                return result, "recent"
+        task = self._inflight.get(key)
+        role = "joined"
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+
+            def finished(task):
+                self._inflight.pop(key, None)
+                if not task.cancelled() and task.exception() is None and keep(task.result()):
+                    self._remember(key, task.result())
+
+            task.add_done_callback(finished)
+            role = "executed"
+        self._count(role)
+        # Pemanggil yang putus tidak membatalkan eksekusi milik pemanggil lain
+        return await asyncio.shield(task), role
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator], reuse_recent: bool = True,
+               keep: Callable = lambda events: True):
+        """
+        Versi streaming dari run: `factory()` menghasilkan async iterator yang dijalankan sekali,
+        setiap pemanggil menerima semua event-nya dari awal. Pemanggil harus langsung membaca
+        event pertama (tanpa await lain di antaranya) dan menutup iteratornya bila berhenti.
+        Returns:
+            tuple: (async iterator event, peran).
+        """
+        if not self.enabled:
+            return factory(), "executed"
+        log = self._get_recent(key) if reuse_recent else None
+        if log is not None:
+            role = "recent"
+        else:
+            log = self._inflight.get(key)
+            role = "joined"
+        if log is None:
+            log = _EventLog()
+            self._inflight[key] = log
+            log.task = asyncio.ensure_future(self._produce(key, log, factory, keep))
+            role = "executed"
+        self._count(role)
+        return self._subscribe(key, log), role
+
+    async def _produce(self, key: str, log: _EventLog, factory: Callable[[], AsyncIterator], keep: Callable):
+        events = factory()
+        try:
+            async for item in events:
+                log.append(item)
+        finally:
+            await events.aclose()
+            log.finish()
+            if self._inflight.get(key) is log:
+                del self._inflight[key]
+                if keep(log.events):
+                    self._remember(key, log)
+
+    async def _subscribe(self, key: str, log: _EventLog):
+        # Dihitung saat iterasi dimulai: iterator yang tidak pernah dibaca tidak menahan pipeline
+        log.subscribers += 1
+        try:
+            async for item in log.replay():
+                yield item
+        finally:
+            log.subscribers -= 1
+            if log.subscribers == 0 and not log.done:
+                # Semua client putus: hentikan pipeline seperti request biasa
+                if self._inflight.get(key) is log:
+                    del self._inflight[key]
+                log.task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "executed": self.executed,
+            "joined": self.joined,
+            "recent_hits": self.recent_hits,
+            "in_flight": len(self._inflight),
+            "recent": len(self._recent),
+        }
@@ -0,0 +1,176 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+from app.audio import (
+    TARGET_SAMPLE_RATE,
+    VAD_DYNAMIC_RANGE_DB,
+    VAD_FRAME_MS,
+    VAD_PADDING_MS,
+    VAD_THRESHOLD_DB,
+    StreamResampler,
+    frame_energy_db,
+)
+
+# Transkrip sementara dibuat setiap kali audio baru sepanjang ini masuk (ms)
+STT_STREAM_PARTIAL_INTERVAL_MS = int(os.getenv("STT_STREAM_PARTIAL_INTERVAL_MS", "800"))
+# Transkrip sementara hanya men-decode detik-detik terakhir ucapan (sliding window)
+STT_STREAM_WINDOW_SECONDS = float(os.getenv("STT_STREAM_WINDOW_SECONDS", "15"))
+# Ucapan dianggap selesai setelah hening selama ini (ms)
+STT_ENDPOINT_SILENCE_MS = int(os.getenv("STT_ENDPOINT_SILENCE_MS", "700"))
+# Jeda sepanjang ini sudah cukup untuk mulai men-decode transkrip final secara spekulatif (ms)
+STT_STREAM_SPECULATIVE_MS = int(os.getenv("STT_STREAM_SPECULATIVE_MS", "300"))
+# Bunyi yang lebih pendek dari ini tidak dianggap awal ucapan (ms)
+STT_STREAM_MIN_SPEECH_MS = int(os.getenv("STT_STREAM_MIN_SPEECH_MS", "150"))
+# Ucapan yang lebih panjang dari ini dipotong paksa (batas satu jendela whisper)
+STT_STREAM_MAX_UTTERANCE_SECONDS = float(os.getenv("STT_STREAM_MAX_UTTERANCE_SECONDS", "30"))
+
+FRAME_SAMPLES = TARGET_SAMPLE_RATE * VAD_FRAME_MS // 1000
+PADDING_SAMPLES = TARGET_SAMPLE_RATE * VAD_PADDING_MS // 1000
+
+
+def _ms_to_samples(ms: float) -> int:
+    return int(TARGET_SAMPLE_RATE * ms / 1000)
+
+
+class StreamingRecognizer:
+    """
+    Status satu ucapan yang sedang direkam: menampung frame PCM dari mikrofon, mendeteksi
+    awal dan akhir ucapan dengan VAD energi per frame, dan menentukan kapan transkrip
+    sementara atau final perlu dibuat. Whisper sendiri dipanggil oleh pemakai kelas ini.
+    Semua indeks sampel relatif terhadap awal ucapan ini, dalam 16 kHz.
+    """
+
+    def __init__(self, sample_rate: int = TARGET_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.utterance_id = 0
+        # Satu resampler untuk seluruh koneksi: audio mikrofon kontinu melintasi batas ucapan
+        self._resampler = StreamResampler(sample_rate)
+        self._reset_state()
+
+    def _reset_state(self):
+        self._chunks = []
+        self._offset = 0  # indeks sampel pertama yang masih disimpan
+        self.total = 0  # jumlah sampel yang sudah masuk
+        self._vad_tail = np.empty(0, dtype=np.float32)
+        self._vad_pos = 0
+        self._peak_db = -np.inf
+        self._first_voiced = None
+        self._voiced_frames = 0
+        self._partial_at = 0
+        self.speech_start = None
+        self.speech_end = None
+        self.forced = False
+
+    def reset(self):
+        """Mulai ucapan berikutnya; audio ucapan sebelumnya dibuang."""
+        self.utterance_id += 1
+        self._reset_state()
+
+    def feed(self, pcm: bytes):
+        """Tambahkan PCM 16-bit little-endian mono pada `sample_rate`."""
+        pcm = pcm[:len(pcm) - len(pcm) % 2]
+        samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768
+        samples = self._resampler.process(samples)
+        if samples.size == 0:
+            return
+        self._chunks.append(samples)
+        self.total += len(samples)
+        self._update_vad(samples)
+        if self.speech_start is None:
+            # Hening sebelum ucapan tidak perlu disimpan, cukup jeda pengaman di depannya
+            anchor = self._first_voiced if self._first_voiced is not None else self._vad_pos
+            self._drop_before(anchor - PADDING_SAMPLES)
+
+    def _update_vad(self, samples: np.ndarray):
+        data = np.concatenate([self._vad_tail, samples])
+        usable = len(data) // FRAME_SAMPLES * FRAME_SAMPLES
+        self._vad_tail = data[usable:]
+        frame_start = self._vad_pos
+        for energy in frame_energy_db(data[:usable], TARGET_SAMPLE_RATE):
+            self._peak_db = max(self._peak_db, float(energy))
+            threshold = max(VAD_THRESHOLD_DB, self._peak_db - VAD_DYNAMIC_RANGE_DB)
+            if energy > threshold:
+                if self._first_voiced is None:
+                    self._first_voiced = frame_start
+                self._voiced_frames += 1
+                self.speech_end = frame_start + FRAME_SAMPLES
+                if self.speech_start is None and \
+                        self._voiced_frames * FRAME_SAMPLES >= _ms_to_samples(STT_STREAM_MIN_SPEECH_MS):
+                    self.speech_start = self._first_voiced
+            elif self.speech_start is None and self._first_voiced is not None and \
+                    frame_start - self.speech_end >= _ms_to_samples(STT_ENDPOINT_SILENCE_MS):
+                # Bunyi singkat (klik, batuk) yang tidak berlanjut menjadi ucapan
+                self._first_voiced = None
+                self._voiced_frames = 0
+                self.speech_end = None
+            frame_start += FRAME_SAMPLES
+        self._vad_pos = frame_start
+
+    def _drop_before(self, index: int):
+        if index <= self._offset:
+            return
+        audio = self._audio(self._offset, self.total)
+        self._chunks = [audio[index - self._offset:]]
+        self._offset = index
+
+    def _audio(self, start: int, end: int) -> np.ndarray:
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        if not self._chunks:
+            return np.empty(0, dtype=np.float32)
+        start = max(start, self._offset)
+        return self._chunks[0][start - self._offset:max(start, end) - self._offset]
+
+    def end(self):
+        """
+        Client menandai akhir ucapan (misalnya tombol rekam dilepas). Diabaikan bila belum ada
+        bunyi sejak reset terakhir, misalnya ucapan sudah diakhiri oleh deteksi hening.
+        """
+        if self._first_voiced is not None:
+            self.forced = True
+
+    @property
+    def started(self) -> bool:
+        return self.speech_start is not None
+
+    @property
+    def silence_ms(self) -> float:
+        if self.speech_end is None:
+            return 0.0
+        return (self._vad_pos - self.speech_end) * 1000 / TARGET_SAMPLE_RATE
+
+    @property
+    def pause_detected(self) -> bool:
+        return self.started and self.silence_ms >= STT_STREAM_SPECULATIVE_MS
+
+    @property
+    def endpoint(self) -> bool:
+        if self.forced:
+            return True
+        if not self.started:
+            return False
+        too_long = self.total - self.speech_start >= STT_STREAM_MAX_UTTERANCE_SECONDS * TARGET_SAMPLE_RATE
+        return too_long or self.silence_ms >= STT_ENDPOINT_SILENCE_MS
+
+    @property
+    def partial_due(self) -> bool:
+        return self.started and self.total - self._partial_at >= _ms_to_samples(STT_STREAM_PARTIAL_INTERVAL_MS)
+
+    def partial_window(self) -> np.ndarray:
+        """Audio untuk transkrip sementara: ucapan sejauh ini, maksimal STT_STREAM_WINDOW_SECONDS terakhir."""
+        self._partial_at = self.total
+        start = max(self.speech_start - PADDING_SAMPLES, self.total - int(STT_STREAM_WINDOW_SECONDS * TARGET_SAMPLE_RATE))
+        return self._audio(start, self.total)
+
+    def utterance(self, info: Optional[dict] = None) -> np.ndarray:
+        """Audio ucapan utuh untuk transkrip final, dengan jeda pengaman di kiri-kanan."""
+        if self.started:
+            audio = self._audio(self.speech_start - PADDING_SAMPLES, self.speech_end + PADDING_SAMPLES)
+        else:
+            audio = np.empty(0, dtype=np.float32)
+        if info is not None:
+            info["audio_seconds"] = round(self.total / TARGET_SAMPLE_RATE, 3)
+            info["speech_seconds"] = round(len(audio) / TARGET_SAMPLE_RATE, 3)
+        return audio
@@ -1,66 +1,424 @@
+import logging
 import os
-import uuid
-import tempfile
+import queue
 import subprocess
+import threading
+import time
+import numpy as np
+import requests
+from typing import Optional
+from app.audio import TARGET_SAMPLE_RATE, AudioDecodeError, SilentAudioError, encode_wav, load_for_stt
+from app.engines import Engine, register_engine
+from app.metrics import STT_ESCALATIONS, STT_TIER_DECODES
+
+logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Path ke folder utilitas STT
 WHISPER_DIR = os.path.join(BASE_DIR, "whisper.cpp")
 
-# Path ke binary whisper-cli
-WHISPER_BINARY = os.path.join(WHISPER_DIR, "build", "bin", "Release",  "whisper-cli.exe")
+# Path ke binary whisper-server (memuat model sekali lalu melayani request via HTTP)
+WHISPER_SERVER_BINARY = os.path.join(WHISPER_DIR, "build", "bin", "Release", "whisper-server.exe")
 
 # Path ke file model Whisper (contoh: ggml-large-v3-turbo.bin)
 WHISPER_MODEL_PATH = os.path.join(WHISPER_DIR, "models", "ggml-large-v3-turbo.bin")
 
-def transcribe_speech_to_text(file_bytes: bytes, file_ext: str = ".wav") -> str:
-    temp_dir = os.path.join(tempfile.gettempdir(), "voice_assistant_stt")
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    audio_path = os.path.join(temp_dir, f"{uuid.uuid4()}{file_ext}")
-    result_path = os.path.join(temp_dir, "transcription.txt")
+# Tier model: model utama di atas, ditambah tier cepat "nama=file" (dipisah koma, urut dari
+# yang tercepat) di folder models. Tier yang file modelnya tidak ada dilewati.
+STT_MAIN_TIER = os.getenv("STT_MAIN_TIER", "turbo")
+STT_FAST_TIERS = os.getenv("STT_FAST_TIERS", "base=ggml-base.bin")
+STT_FAST_POOL_SIZE = int(os.getenv("STT_FAST_POOL_SIZE", "1"))
+
+# Klip dengan ucapan sependek ini (detik, setelah trimming hening) atau yang datang saat semua
+# engine model utama sibuk dicoba di tier cepat dulu
+STT_SHORT_CLIP_SECONDS = float(os.getenv("STT_SHORT_CLIP_SECONDS", "4"))
+
+# Hasil tier cepat di-decode ulang dengan tier berikutnya bila rata-rata log-prob token di bawah
+# ambang ini atau probabilitas no-speech di atas ambang ini
+STT_ESCALATE_LOGPROB = float(os.getenv("STT_ESCALATE_LOGPROB", "-0.8"))
+STT_ESCALATE_NO_SPEECH = float(os.getenv("STT_ESCALATE_NO_SPEECH", "0.6"))
+
+# Jumlah engine whisper yang tetap hangat dan port awal yang dipakai
+STT_POOL_SIZE = int(os.getenv("STT_POOL_SIZE", "1"))
+STT_BASE_PORT = int(os.getenv("STT_BASE_PORT", "8910"))
+STT_STARTUP_TIMEOUT = float(os.getenv("STT_STARTUP_TIMEOUT", "120"))
+STT_REQUEST_TIMEOUT = float(os.getenv("STT_REQUEST_TIMEOUT", "120"))
+
+# Thread per engine (0 = otomatis: semua core dibagi rata ke engine model utama dan tier cepat)
+STT_THREADS = int(os.getenv("STT_THREADS", "0"))
+
+# Error STT yang disebabkan isi upload, bukan kegagalan engine: dibalas 4xx oleh API
+STT_CLIENT_ERRORS = (
+    ("[ERROR] Empty audio file", 400),
+    ("[ERROR] Failed to decode audio", 400),
+    ("[ERROR] Audio too short", 422),
+    ("[ERROR] No speech detected", 422),
+    ("[ERROR] Empty transcript generated", 422),
+)
+
+# Bila port engine sudah dilayani whisper-server milik worker uvicorn lain, pakai engine itu
+# alih-alih memuat model lagi; satu set engine per node untuk semua worker
+STT_SHARED_ENGINES = os.getenv("STT_SHARED_ENGINES", "1") == "1"
+
+
+class WhisperEngine:
+    """Satu proses whisper-server yang memuat model sekali dan tetap hangat."""
+
+    def __init__(self, port: int, threads: int = 1, shared: bool = False,
+                 model_path: str = WHISPER_MODEL_PATH):
+        self.port = port
+        self.threads = threads
+        self.shared = shared
+        self.model_path = model_path
+        self.url = f"http://127.0.0.1:{port}"
+        self.process = None
+        self.session = requests.Session()
+
+    def _healthy(self) -> bool:
+        try:
+            response = self.session.get(f"{self.url}/health", timeout=1)
+        except requests.RequestException:
+            return False
+        # whisper-server versi lama tidak punya /health, tapi baru listen setelah model dimuat
+        return response.status_code != 503
+
+    def start(self):
+        if self.shared and self._healthy():
+            logger.info("Using shared STT engine on port %s", self.port)
+            return
+
+        cmd = [
+            WHISPER_SERVER_BINARY,
+            "-m", self.model_path,
+            "--host", "127.0.0.1",
+            "--port", str(self.port),
+            "--no-gpu",  # Nonaktifkan GPU
+            "-l", "id",  # Bahasa Indonesia
+            "--threads", str(self.threads),
+        ]
+        logger.info("Starting STT engine: %s", " ".join(cmd))
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        # Tunggu sampai model selesai dimuat dan server siap menerima request
+        deadline = time.monotonic() + STT_STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process is not None and self.process.poll() is not None:
+                if not self.shared:
+                    raise RuntimeError(f"whisper-server exited with code {self.process.returncode}")
+                # Port sudah diambil worker lain yang sedang memuat model; tunggu engine miliknya
+                logger.info("STT port %s taken by another worker, waiting for its engine", self.port)
+                self.process = None
+            if self._healthy():
+                logger.info("STT engine ready on port %s", self.port)
+                return
+            time.sleep(0.5)
+
+        self.stop()
+        raise RuntimeError(f"whisper-server on port {self.port} not ready after {STT_STARTUP_TIMEOUT}s")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def is_alive(self) -> bool:
+        if self.process is not None:
+            return self.process.poll() is None
+        # Engine milik worker lain hanya bisa dicek lewat HTTP
+        return self.shared and self._healthy()
+
+    def _inference(self, wav_bytes: bytes, response_format: str) -> dict:
+        # Audio sudah berupa WAV mono 16 kHz di memori, jadi server tidak perlu konversi/file sementara
+        files = {"file": ("audio.wav", wav_bytes, "audio/wav")}
+        data = {"response_format": response_format, "temperature": "0.0"}
+        response = self.session.post(f"{self.url}/inference", files=files, data=data, timeout=STT_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def transcribe(self, wav_bytes: bytes) -> str:
+        return self._inference(wav_bytes, "json").get("text", "").strip()
+
+    def transcribe_verbose(self, wav_bytes: bytes) -> dict:
+        """Transkrip beserta keyakinannya: {"text", "avg_logprob", "no_speech_prob"}."""
+        result = self._inference(wav_bytes, "verbose_json")
+        return {"text": result.get("text", "").strip(), **_confidence(result.get("segments") or [])}
+
+
+def _confidence(segments: list) -> dict:
+    # Rata-rata per segmen dibobot jumlah token; kosong bila server tidak melaporkannya
+    scored = [segment for segment in segments if "avg_logprob" in segment]
+    if not scored:
+        return {}
+    weights = [max(1, len(segment.get("tokens") or [])) for segment in scored]
+    total = sum(weights)
+    return {
+        "avg_logprob": round(sum(w * s["avg_logprob"] for w, s in zip(weights, scored)) / total, 4),
+        "no_speech_prob": round(sum(w * s.get("no_speech_prob", 0.0) for w, s in zip(weights, scored)) / total, 4),
+    }
+
+
+class WhisperEnginePool:
+    """Kumpulan engine whisper yang dipinjam bergantian oleh request."""
+
+    def __init__(self, size: int, base_port: int, threads: int = 1, shared: bool = False,
+                 model_path: str = WHISPER_MODEL_PATH):
+        self._engines = [WhisperEngine(base_port + i, threads, shared, model_path) for i in range(max(1, size))]
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+
+    @property
+    def size(self) -> int:
+        return len(self._engines)
+
+    def set_threads(self, threads: int):
+        """Ubah jumlah thread per engine; berlaku untuk engine yang dimulai setelah ini."""
+        for engine in self._engines:
+            engine.threads = threads
+
+    @property
+    def idle(self) -> int:
+        """Jumlah engine yang sedang tidak dipakai request."""
+        return self._idle.qsize()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for engine in self._engines:
+                engine.start()
+                self._idle.put(engine)
+            self._started = True
+
+    def stop(self):
+        with self._lock:
+            for engine in self._engines:
+                engine.stop()
+            self._idle = queue.Queue()
+            self._started = False
+
+    def _run(self, method: str, wav_bytes: bytes):
+        self.start()
+        engine = self._idle.get()
+        try:
+            if not engine.is_alive():
+                logger.warning("STT engine on port %s is down, restarting", engine.port)
+                engine.start()
+            return getattr(engine, method)(wav_bytes)
+        finally:
+            self._idle.put(engine)
+
+    def transcribe(self, wav_bytes: bytes) -> str:
+        return self._run("transcribe", wav_bytes)
+
+    def transcribe_verbose(self, wav_bytes: bytes) -> dict:
+        return self._run("transcribe_verbose", wav_bytes)
+
+    def warmup(self, wav_bytes: bytes):
+        """Jalankan satu transkripsi dummy di setiap engine."""
+        self.start()
+        engines = [self._idle.get() for _ in self._engines]
+        try:
+            for engine in engines:
+                engine.transcribe(wav_bytes)
+        finally:
+            for engine in engines:
+                self._idle.put(engine)
+
+
+# Pool model utama (tier paling akurat)
+stt_pool = WhisperEnginePool(STT_POOL_SIZE, STT_BASE_PORT, shared=STT_SHARED_ENGINES)
+
+
+def create_fast_tiers(spec: str, base_port: int, pool_size: int = STT_FAST_POOL_SIZE) -> list:
+    """Buat pool untuk setiap tier cepat dari spesifikasi "nama=file,..."; port dimulai dari base_port."""
+    tiers = []
+    for item in spec.split(","):
+        name, _, filename = item.strip().partition("=")
+        if not name or not filename:
+            continue
+        model_path = os.path.join(WHISPER_DIR, "models", filename.strip())
+        if not os.path.exists(model_path):
+            logger.warning("Whisper model for STT tier %s not found at %s, tier skipped", name, model_path)
+            continue
+        port = base_port + len(tiers) * pool_size
+        pool = WhisperEnginePool(pool_size, port, shared=STT_SHARED_ENGINES, model_path=model_path)
+        tiers.append((name.strip(), pool))
+    return tiers
 
-    with open(audio_path, "wb") as f:
-        f.write(file_bytes)
 
-    if not os.path.exists(audio_path):
-        return "[ERROR] Failed to create audio file"
-    if os.path.getsize(audio_path) == 0:
+# Tier cepat memakai port setelah engine model utama
+fast_tiers = create_fast_tiers(STT_FAST_TIERS, STT_BASE_PORT + STT_POOL_SIZE)
+
+
+def _tiers() -> list:
+    return fast_tiers + [(STT_MAIN_TIER, stt_pool)]
+
+
+def stt_threads(engines: int) -> int:
+    if STT_THREADS > 0:
+        return STT_THREADS
+    return max(1, (os.cpu_count() or 4) // max(1, engines))
+
+
+def configure_stt_threads(threads: int = 0):
+    """Bagi core ke semua engine whisper (model utama dan setiap tier cepat) yang berjalan bersamaan."""
+    pools = [pool for _, pool in _tiers()]
+    threads = threads or stt_threads(sum(pool.size for pool in pools))
+    for pool in pools:
+        pool.set_threads(threads)
+
+
+configure_stt_threads()
+
+
+def start_stt_engines():
+    for _, pool in _tiers():
+        pool.start()
+
+
+def stop_stt_engines():
+    for _, pool in _tiers():
+        pool.stop()
+
+
+def _warmup_stt():
+    # Satu detik hening cukup untuk memicu alokasi buffer encoder/decoder whisper
+    wav_bytes = encode_wav(np.zeros(TARGET_SAMPLE_RATE, dtype=np.float32))
+    for _, pool in _tiers():
+        pool.warmup(wav_bytes)
+
+
+stt_engine = register_engine(Engine("stt", start_stt_engines, warmup=_warmup_stt, unload=stop_stt_engines))
+
+
+def transcribe_speech_to_text(file_bytes: bytes, file_ext: str = ".wav", info: Optional[dict] = None) -> str:
+    """
+    Transkripsi audio upload. Bila `info` diberikan, detail pemrosesan
+    (durasi audio sebelum/sesudah trimming hening) dicatat ke dalamnya.
+    """
+    if not file_bytes:
         return "[ERROR] Empty audio file"
 
-    cmd = [
-        WHISPER_BINARY,
-        "-m", WHISPER_MODEL_PATH,
-        "-f", audio_path,
-        "-otxt",
-        "-of", os.path.join(temp_dir, "transcription"),
-        "--no-gpu",  # Nonaktifkan GPU
-        "-l", "id",  # Bahasa Indonesia
-        "--threads", "4"  # Batasi thread untuk stabilitas
-    ]
+    # Decode upload di memori menjadi PCM mono 16 kHz; file_ext hanya informasi dari client
+    try:
+        samples = load_for_stt(file_bytes, info)
+    except SilentAudioError as e:
+        logger.info("Rejected silent audio: %s", e)
+        return f"[ERROR] {e}"
+    except AudioDecodeError as e:
+        logger.error("Failed to decode audio (%s): %s", file_ext, e)
+        return f"[ERROR] Failed to decode audio: {e}"
 
+    return transcribe_samples(samples, info)
+
+
+def error_status(error: str) -> int:
+    """Kode HTTP untuk pesan error pipeline: 4xx untuk upload yang tidak bisa ditranskripsi, selain itu 500."""
+    for prefix, status in STT_CLIENT_ERRORS:
+        if error.startswith(prefix):
+            return status
+    return 500
+
+
+def transcribe_samples(samples: np.ndarray, info: Optional[dict] = None) -> str:
+    """Transkripsi sampel mono 16 kHz yang sudah dipotong heningnya (lewat tier STT)."""
     try:
-        print(f"[INFO] Running STT command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-        print(f"[INFO] STT stdout: {result.stdout}")
-    except subprocess.CalledProcessError as e:
-        print(f"[ERROR] Whisper failed: {e}")
-        print(f"[ERROR] Whisper stderr: {e.stderr}")
+        stt_engine.ensure()
+        transcript = _transcribe_tiered(encode_wav(samples), len(samples) / TARGET_SAMPLE_RATE, info)
+    except Exception as e:
+        logger.error("Whisper failed: %s", e)
         return f"[ERROR] Whisper failed: {e}"
-    
+
+    if not transcript:
+        return "[ERROR] Empty transcript generated"
+
+    return transcript
+
+
+def transcribe_partial(samples: np.ndarray) -> str:
+    """
+    Transkrip sementara untuk streaming: tier tercepat tanpa eskalasi dan tanpa
+    masuk metrik tier, karena hasilnya akan diganti transkrip final.
+    """
     try:
-        if not os.path.exists(result_path):
-            print(f"[ERROR] Transcription file not found at: {result_path}")
-            return "[ERROR] Transcription file not found"
-            
-        with open(result_path, "r", encoding="utf-8") as result_file:
-            transcript = result_file.read().strip()
-            
-        if not transcript:
-            return "[ERROR] Empty transcript generated"
-            
-        return transcript
+        stt_engine.ensure()
+        _, pool = _tiers()[0]
+        return pool.transcribe(encode_wav(samples))
     except Exception as e:
-        print(f"[ERROR] Failed to read transcription: {str(e)}")
-        return f"[ERROR] Failed to read transcription: {str(e)}"
\ No newline at end of file
+        logger.warning("Partial transcription failed: %s", e)
+        return f"[ERROR] Whisper failed: {e}"
+
+
+def _escalation_reason(result: dict) -> Optional[str]:
+    if not result["text"]:
+        return "empty"
+    if "avg_logprob" not in result:
+        # whisper-server lama tidak melaporkan log-prob; anggap tidak yakin
+        return "no_confidence"
+    if result["avg_logprob"] < STT_ESCALATE_LOGPROB:
+        return "low_logprob"
+    if result["no_speech_prob"] > STT_ESCALATE_NO_SPEECH:
+        return "no_speech"
+    return None
+
+
+def _transcribe_tiered(wav_bytes: bytes, speech_seconds: float, info: Optional[dict] = None) -> str:
+    """
+    Pilih tier awal (cepat untuk klip pendek atau saat model utama penuh), lalu naik satu
+    tier setiap kali hasil tier cepat kurang yakin. Tier dan alasan eskalasi dicatat ke `info`.
+    """
+    tiers = _tiers()
+    if len(tiers) == 1:
+        index, route = 0, "main"
+    elif speech_seconds <= STT_SHORT_CLIP_SECONDS:
+        index, route = 0, "short_clip"
+    elif stt_pool.idle == 0:
+        index, route = 0, "high_load"
+    else:
+        index, route = len(tiers) - 1, "main"
+
+    escalations = []
+    while True:
+        name, pool = tiers[index]
+        STT_TIER_DECODES.inc(tier=name)
+        if index == len(tiers) - 1:
+            transcript = pool.transcribe(wav_bytes)
+            break
+        result = pool.transcribe_verbose(wav_bytes)
+        reason = _escalation_reason(result)
+        if reason is None:
+            transcript = result["text"]
+            break
+        STT_ESCALATIONS.inc(tier=name, reason=reason)
+        logger.debug("STT tier %s not confident (%s: %s), escalating", name, reason, result)
+        escalations.append({"tier": name, "reason": reason, **result})
+        index += 1
+
+    if info is not None:
+        info["tier"] = name
+        info["route"] = route
+        info["escalated"] = bool(escalations)
+        if escalations:
+            info["escalations"] = [{k: v for k, v in e.items() if k != "text"} for e in escalations]
+        elif index < len(tiers) - 1:
+            info.update({k: v for k, v in result.items() if k != "text"})
+    return transcript
+
+
+def transcribe_record(name: str, file_bytes: bytes) -> dict:
+    """Transkripsi satu file untuk mode bulk; hasilnya satu baris JSONL (text atau error)."""
+    info = {}
+    start = time.perf_counter()
+    transcript = transcribe_speech_to_text(file_bytes, os.path.splitext(name)[1], info)
+    record = {"file": name, **info, "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)}
+    if transcript.startswith("[ERROR]"):
+        record["error"] = transcript
+    else:
+        record["text"] = transcript
+    return record
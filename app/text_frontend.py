@@ -0,0 +1,124 @@
+import functools
+import logging
+import re
+
+from num2words import num2words
+
+logger = logging.getLogger(__name__)
+
+# Angka, termasuk yang punya pemisah ribuan (misalnya 1.000 atau 25,000)
+NUMBER_PATTERN = re.compile(r"\b\d{1,3}(?:[,.]\d{3})*\b")
+
+# Karakter yang dipertahankan g2p-id sebelum tokenisasi; sisanya jadi pemisah kata
+UNSUPPORTED_CHAR_PATTERN = re.compile(r"[^ a-z0-9'\.,?!]+")
+
+# Token kata atau satu tanda baca
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+|[^\sa-z0-9']")
+LETTER_PATTERN = re.compile(r"[a-z]")
+
+
+@functools.lru_cache(maxsize=1024)
+def _number_to_words(num_str: str) -> str:
+    # Hapus tanda titik atau koma untuk mendapatkan angka murni
+    clean_num = num_str.replace(".", "").replace(",", "")
+    try:
+        # Konversi angka ke kata dalam Bahasa Indonesia
+        return num2words(int(clean_num), lang="id")
+    except ValueError:
+        return num_str  # Kembalikan asli jika bukan angka valid
+
+
+def phonemes_to_text(phonemes) -> str:
+    """
+    Output g2p-id -> string untuk Coqui: fonem satu kata digabung, antar kata dipisah spasi
+    (misalnya "halo , apa kabar ?"). g2p-id rilis mengembalikan List[List[str]] per kata,
+    versi lama sudah berupa string.
+    """
+    if isinstance(phonemes, str):
+        return phonemes
+    return " ".join("".join(word) for word in phonemes)
+
+
+class TextFrontend:
+    """
+    Front-end teks untuk TTS: angka -> kata, lalu g2p per kata dengan cache LRU.
+    Kata bahasa Indonesia sangat sering berulang antar balasan, jadi sebagian
+    besar kata cukup diambil dari cache tanpa memanggil model g2p.
+    """
+
+    def __init__(self, g2p, cache_size: int = 50000):
+        self._g2p = g2p
+        # Homograf butuh konteks kalimat (POS tag), jadi tidak bisa di-cache per kata
+        self._homographs = set(getattr(g2p, "homograph2features", None) or ())
+        # Preprocessing kalimat milik g2p-id (tokenizer, lipat aksen, normalizer mata uang/satuan,
+        # elipsis) harus jalan sebelum kalimat dipecah per kata, agar hasilnya sama dengan g2p satu kalimat
+        self._preprocess = getattr(g2p, "_preprocess", None)
+        self._phonemize_word = functools.lru_cache(maxsize=cache_size)(self._g2p_word)
+
+    def _g2p_word(self, word: str) -> str:
+        return phonemes_to_text(self._g2p(word))
+
+    @staticmethod
+    def normalize_numbers(text: str) -> str:
+        return NUMBER_PATTERN.sub(lambda match: _number_to_words(match.group(0)), text)
+
+    def _tokenize(self, text: str) -> list:
+        if self._preprocess is not None:
+            return self._preprocess(text).split()
+        text = UNSUPPORTED_CHAR_PATTERN.sub(" ", text.lower())
+        return TOKEN_PATTERN.findall(text)
+
+    def _has_homograph(self, tokens: list) -> bool:
+        return any(token in self._homographs for token in tokens)
+
+    @staticmethod
+    def _join(tokens: list, phonemes: dict) -> str:
+        return " ".join(phonemes[token] if LETTER_PATTERN.search(token) else token for token in tokens)
+
+    def phonemize(self, text: str) -> str:
+        tokens = self._tokenize(text)
+        if self._has_homograph(tokens):
+            return phonemes_to_text(self._g2p(text))
+        phonemes = {token: self._phonemize_word(token) for token in tokens if LETTER_PATTERN.search(token)}
+        return self._join(tokens, phonemes)
+
+    def process(self, text: str) -> str:
+        """Ubah teks balasan menjadi input Coqui (fonem IPA, atau teks bila g2p gagal)."""
+        processed_text = self.normalize_numbers(text)
+        try:
+            return self.phonemize(processed_text)
+        except Exception as e:
+            logger.warning("G2P conversion failed: %s. Falling back to processed text.", e)
+            return processed_text  # Fallback ke teks asli jika G2P gagal
+
+    def process_batch(self, texts: list) -> list:
+        """Proses banyak kalimat sekaligus; kata unik di seluruh batch hanya di-g2p sekali."""
+        normalized = [self.normalize_numbers(text) for text in texts]
+        tokenized = [self._tokenize(text) for text in normalized]
+        words = {
+            token
+            for tokens in tokenized if not self._has_homograph(tokens)
+            for token in tokens if LETTER_PATTERN.search(token)
+        }
+        phonemes = {}
+        for word in words:
+            try:
+                phonemes[word] = self._phonemize_word(word)
+            except Exception as e:
+                # Kalimat yang memuat kata ini jatuh ke teks biasa, kalimat lain tetap diproses
+                logger.warning("G2P conversion failed for %r: %s", word, e)
+
+        results = []
+        for text, tokens in zip(normalized, tokenized):
+            try:
+                if self._has_homograph(tokens):
+                    results.append(phonemes_to_text(self._g2p(text)))
+                else:
+                    results.append(self._join(tokens, phonemes))
+            except Exception as e:
+                logger.warning("G2P conversion failed: %s. Falling back to processed text.", e)
+                results.append(text)
+        return results
+
+    def cache_info(self):
+        return self._phonemize_word.cache_info()
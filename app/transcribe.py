@@ -0,0 +1,109 @@
+"""
+Transkripsi massal satu folder rekaman lewat pool whisper-server.
+
+Contoh:
+    python -m app.transcribe rekaman/ --workers 4 --output transkrip.jsonl
+
+Setiap file yang selesai langsung ditulis sebagai satu baris JSON
+(file, text atau error, durasi audio, waktu proses).
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import app.stt as stt
+from app.log import configure_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTENSIONS = ".wav,.flac,.ogg,.mp3"
+
+# whisper.cpp jarang lebih cepat di atas ~4 thread per engine; core sisanya lebih berguna
+# untuk engine tambahan yang memproses file lain secara paralel
+THREADS_PER_ENGINE = 4
+
+
+def parse_args(argv=None):
+    cpu_count = os.cpu_count() or 4
+    parser = argparse.ArgumentParser(description="Bulk transcription of a directory of recordings")
+    parser.add_argument("directory", help="Folder berisi rekaman (dibaca rekursif)")
+    parser.add_argument("--output", help="Tulis JSONL ke file ini (default: stdout)")
+    parser.add_argument("--workers", type=int, default=max(1, cpu_count // THREADS_PER_ENGINE),
+                        help=f"Jumlah engine whisper (default: jumlah core / {THREADS_PER_ENGINE})")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Thread per engine (default: jumlah core / jumlah engine, termasuk tier cepat)")
+    parser.add_argument("--base-port", type=int, default=stt.STT_BASE_PORT)
+    parser.add_argument("--fast-tiers", default="",
+                        help="Tier cepat, format seperti STT_FAST_TIERS (default mati: di mode bulk semua "
+                             "engine selalu sibuk sehingga hampir semua file akan lewat tier cepat)")
+    parser.add_argument("--extensions", default=DEFAULT_EXTENSIONS, help="Ekstensi file, dipisah koma")
+    args = parser.parse_args(argv)
+    args.workers = max(1, args.workers)
+    return args
+
+
+def find_audio_files(directory: str, extensions: tuple):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(extensions):
+                yield os.path.join(root, name)
+
+
+def _transcribe_path(path: str, directory: str) -> dict:
+    name = os.path.relpath(path, directory)
+    try:
+        with open(path, "rb") as f:
+            file_bytes = f.read()
+    except OSError as e:
+        return {"file": name, "error": f"[ERROR] Failed to read file: {e}"}
+    return stt.transcribe_record(name, file_bytes)
+
+
+def transcribe_directory(directory: str, extensions: tuple, workers: int):
+    """Sebar file ke `workers` thread dan hasilkan record sesuai urutan selesai."""
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stt") as executor:
+        pending = set()
+        for path in find_audio_files(directory, extensions):
+            # Batasi file yang sudah dibaca ke memori tapi belum diproses
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(_transcribe_path, path, directory))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def main(argv=None):
+    configure_logging()
+    args = parse_args(argv)
+    extensions = tuple(ext.strip().lower() for ext in args.extensions.split(",") if ext.strip())
+
+    stt.stt_pool = stt.WhisperEnginePool(args.workers, args.base_port)
+    # Tier cepat, bila dipakai, diberi engine sebanyak tier utama agar tidak jadi leher botol
+    stt.fast_tiers = stt.create_fast_tiers(args.fast_tiers, args.base_port + args.workers, args.workers)
+    stt.configure_stt_threads(args.threads)
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    done = failed = 0
+    try:
+        stt.stt_engine.ensure()
+        for record in transcribe_directory(args.directory, extensions, args.workers):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            done += 1
+            failed += "error" in record
+    finally:
+        stt.stt_engine.shutdown()
+        if output is not sys.stdout:
+            output.close()
+    logger.info("Transcribed %d files (%d failed)", done, failed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
+import logging
 import os
-import uuid
+import io
+import threading
 import tempfile
-import subprocess
 import wave
-import re
-from g2p_id import G2P
-from num2words import num2words
+from app.audio import encode_opus
+from app.audio_spool import AudioSpool
+from app.engines import Engine, register_engine
+from app.tts_pool import SynthesizerPool, TTSError
+from app.tts_cache import TTSCache
+from app.text_frontend import TextFrontend
+
+logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -21,8 +27,129 @@ COQUI_CONFIG_PATH = os.path.join(COQUI_DIR, "config.json")
 # Nama speaker yang digunakan
 COQUI_SPEAKER = "ardi"
 
-# Inisialisasi g2p-id
-g2p = G2P()
+# Jumlah proses Coqui yang tetap hangat dan batas waktunya
+TTS_POOL_SIZE = int(os.getenv("TTS_POOL_SIZE", "1"))
+TTS_STARTUP_TIMEOUT = float(os.getenv("TTS_STARTUP_TIMEOUT", "300"))
+TTS_REQUEST_TIMEOUT = float(os.getenv("TTS_REQUEST_TIMEOUT", "120"))
+TTS_HEALTH_INTERVAL = float(os.getenv("TTS_HEALTH_INTERVAL", "30"))
+
+# Thread torch per proses TTS; 0 = core dibagi ke semua proses TTS di node (lihat configure_tts_threads)
+TTS_THREADS = int(os.getenv("TTS_THREADS", "0"))
+
+# Bobot Coqui di-memory-map read-only agar dibagi semua proses lewat page cache
+TTS_MMAP_WEIGHTS = os.getenv("TTS_MMAP_WEIGHTS", "1") == "1"
+
+# Micro-batching: request yang datang dalam jendela waktu yang sama digabung per worker (1 = tanpa batch)
+TTS_MAX_BATCH_SIZE = int(os.getenv("TTS_MAX_BATCH_SIZE", "8"))
+TTS_MAX_BATCH_WAIT_MS = float(os.getenv("TTS_MAX_BATCH_WAIT_MS", "20"))
+
+# Batas jumlah kata yang fonemnya disimpan di cache g2p
+TTS_G2P_CACHE_SIZE = int(os.getenv("TTS_G2P_CACHE_SIZE", "50000"))
+
+# Codec audio balasan bila client tidak memilih: "wav" (PCM 16-bit) atau "opus" (Ogg Opus)
+TTS_OUTPUT_CODEC = os.getenv("TTS_OUTPUT_CODEC", "wav")
+TTS_OPUS_BITRATE = int(os.getenv("TTS_OPUS_BITRATE", "24000"))
+
+# Codec yang didukung: (media type, ekstensi file)
+AUDIO_CODECS = {
+    "wav": ("audio/wav", "wav"),
+    "opus": ("audio/ogg; codecs=opus", "ogg"),
+}
+
+# Kalimat pendek untuk warmup engine TTS setelah server start
+TTS_WARMUP_TEXT = os.getenv("TTS_WARMUP_TEXT", "Halo, ada yang bisa saya bantu?")
+
+def tts_threads(server_workers: int = 1) -> int:
+    if TTS_THREADS > 0:
+        return TTS_THREADS
+    return max(1, (os.cpu_count() or 4) // max(1, TTS_POOL_SIZE * server_workers))
+
+# g2p-id (dibungkus front-end dengan cache per kata) baru dimuat saat pertama kali dipakai
+text_frontend = None
+_text_frontend_lock = threading.Lock()
+
+def get_text_frontend() -> TextFrontend:
+    global text_frontend
+    if text_frontend is None:
+        with _text_frontend_lock:
+            if text_frontend is None:
+                try:
+                    from g2p_id import G2P
+                except ImportError:
+                    # Nama kelas di rilis g2p-id 0.4.x
+                    from g2p_id import G2p as G2P
+                text_frontend = TextFrontend(G2P(), cache_size=TTS_G2P_CACHE_SIZE)
+    return text_frontend
+
+# Pool synthesizer Coqui: model dimuat sekali per worker, bukan per request
+tts_pool = SynthesizerPool(
+    TTS_POOL_SIZE,
+    COQUI_MODEL_PATH,
+    COQUI_CONFIG_PATH,
+    COQUI_SPEAKER,
+    startup_timeout=TTS_STARTUP_TIMEOUT,
+    request_timeout=TTS_REQUEST_TIMEOUT,
+    health_interval=TTS_HEALTH_INTERVAL,
+    max_batch_size=TTS_MAX_BATCH_SIZE,
+    max_batch_wait=TTS_MAX_BATCH_WAIT_MS / 1000,
+    threads=tts_threads(),
+    mmap_weights=TTS_MMAP_WEIGHTS,
+)
+
+def configure_tts_threads(server_workers: int):
+    """Bagi core ke proses TTS milik semua `server_workers` worker server di node ini."""
+    tts_pool.set_threads(tts_threads(server_workers))
+
+# Cache audio untuk balasan yang berulang (salam, "tidak tahu", pesan error, dst.)
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "voice_assistant_tts_cache"))
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+def _model_fingerprint() -> str:
+    # Kunci cache berubah otomatis bila speaker, checkpoint, atau config diganti
+    parts = [COQUI_SPEAKER]
+    for path in (COQUI_MODEL_PATH, COQUI_CONFIG_PATH):
+        try:
+            stat = os.stat(path)
+            parts.append(f"{path}:{stat.st_size}:{stat.st_mtime_ns}")
+        except OSError:
+            parts.append(path)
+    return "|".join(parts)
+
+tts_cache = TTSCache(TTS_CACHE_DIR, _model_fingerprint(), TTS_CACHE_MEMORY_BYTES, TTS_CACHE_DISK_BYTES)
+
+# Spool audio balasan: kecil di memori, besar ke disk, semuanya kedaluwarsa setelah TTL
+AUDIO_SPOOL_DIR = os.getenv("AUDIO_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "voice_assistant_tts"))
+AUDIO_SPOOL_MEMORY_THRESHOLD = int(os.getenv("AUDIO_SPOOL_MEMORY_THRESHOLD", str(1024 * 1024)))
+AUDIO_SPOOL_MEMORY_BYTES = int(os.getenv("AUDIO_SPOOL_MEMORY_BYTES", str(64 * 1024 * 1024)))
+AUDIO_SPOOL_DISK_BYTES = int(os.getenv("AUDIO_SPOOL_DISK_BYTES", str(256 * 1024 * 1024)))
+AUDIO_SPOOL_TTL = float(os.getenv("AUDIO_SPOOL_TTL", "300"))
+AUDIO_SPOOL_SWEEP_INTERVAL = float(os.getenv("AUDIO_SPOOL_SWEEP_INTERVAL", "30"))
+
+audio_spool = AudioSpool(
+    AUDIO_SPOOL_DIR,
+    AUDIO_SPOOL_MEMORY_THRESHOLD,
+    AUDIO_SPOOL_MEMORY_BYTES,
+    AUDIO_SPOOL_DISK_BYTES,
+    AUDIO_SPOOL_TTL,
+    AUDIO_SPOOL_SWEEP_INTERVAL,
+)
+
+def start_tts_engines():
+    tts_pool.start()
+
+def stop_tts_engines():
+    tts_pool.stop()
+
+def _load_tts():
+    get_text_frontend()
+    start_tts_engines()
+
+def _warmup_tts():
+    # Lewat pool langsung agar kalimat warmup tidak masuk cache audio
+    tts_pool.warmup(get_text_frontend().process(TTS_WARMUP_TEXT))
+
+tts_engine = register_engine(Engine("tts", _load_tts, warmup=_warmup_tts, unload=stop_tts_engines))
 
 def transcribe_text_to_speech(text: str) -> str:
     """
@@ -30,105 +157,83 @@ def transcribe_text_to_speech(text: str) -> str:
     Args:
         text (str): Teks yang akan diubah menjadi suara.
     Returns:
-        str: Path ke file audio hasil konversi.
+        str: ID audio di spool (lihat `audio_spool`), atau pesan "[ERROR] ...".
+    """
+    return _tts_with_coqui(text)
+
+def synthesize_speech(text: str) -> bytes:
+    """
+    Ubah teks menjadi audio WAV di memori (angka -> kata, g2p, lalu pool Coqui).
+    Teks yang pernah disintesis diambil langsung dari cache.
+    Raises:
+        TTSError: Jika sintesis gagal.
     """
-    path = _tts_with_coqui(text)
-    return path
+    cache_key = tts_cache.key(text)
+    audio_bytes = tts_cache.get(cache_key)
+    if audio_bytes is not None:
+        return audio_bytes
+
+    tts_engine.ensure()
+    input_text = get_text_frontend().process(text)
+    audio_bytes = tts_pool.synthesize(input_text)
+    tts_cache.put(cache_key, audio_bytes)
+    return audio_bytes
 
 # === ENGINE 1: Coqui TTS ===
 def _tts_with_coqui(text: str) -> str:
-    # Create a more permanent temp directory (not in /tmp which may be cleaned up)
-    output_dir = os.path.join(tempfile.gettempdir(), "voice_assistant_tts")
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Create unique filename
-    output_path = os.path.join(output_dir, f"tts_{uuid.uuid4()}.wav")
-
-    # Langkah 1: Konversi angka ke teks (misalnya, "17" menjadi "tujuh belas")
-    def convert_numbers_to_words(text):
-        def replace_number(match):
-            num_str = match.group(0)
-            # Hapus tanda titik atau koma untuk mendapatkan angka murni
-            clean_num = num_str.replace(".", "").replace(",", "")
-            try:
-                # Konversi angka ke kata dalam Bahasa Indonesia
-                return num2words(int(clean_num), lang='id')
-            except ValueError:
-                return num_str  # Kembalikan asli jika bukan angka valid
-        
-        # Ganti semua angka dalam teks, termasuk yang punya pemisah ribuan
-        pattern = r'\b\d{1,3}(?:[,.]\d{3})*\b'
-        return re.sub(pattern, replace_number, text)
-
-    processed_text = convert_numbers_to_words(text)
-    print(f"[INFO] Text after number conversion: {processed_text}")
-
-    # Langkah 2: Coba konversi ke fonem IPA menggunakan g2p-id
     try:
-        phonemes = g2p(processed_text)
-        print(f"[INFO] Phonemes generated: {phonemes}")
-        input_text = phonemes
+        audio_bytes = synthesize_speech(text)
+    except TTSError as e:
+        logger.error("TTS synthesis failed: %s", e)
+        return "[ERROR] Failed to synthesize speech"
     except Exception as e:
-        print(f"[WARNING] G2P conversion failed: {e}. Falling back to processed text.")
-        input_text = processed_text  # Fallback ke teks asli jika G2P gagal
-
-    # Langkah 3: Gunakan input teks (fonem IPA atau teks asli) untuk Coqui TTS
-    cmd = [
-        "tts",
-        "--text", input_text,
-        "--model_path", COQUI_MODEL_PATH,
-        "--config_path", COQUI_CONFIG_PATH,
-        "--speaker_idx", COQUI_SPEAKER,
-        "--out_path", output_path
-    ]
-    
+        logger.error("Unexpected error in TTS: %s", e)
+        return f"[ERROR] {str(e)}"
+    return spool_speech_audio(audio_bytes)
+
+def encode_speech_audio(audio_bytes: bytes, codec: str) -> bytes:
+    """Ubah audio WAV hasil sintesis ke codec keluaran (lihat AUDIO_CODECS)."""
+    if codec == "opus":
+        return encode_opus(audio_bytes, TTS_OPUS_BITRATE)
+    return audio_bytes
+
+def validate_wav(audio_bytes: bytes) -> str:
+    """
+    Validasi audio WAV langsung dari buffer di memori.
+    Returns:
+        str: String kosong bila valid, atau pesan "[ERROR] ..." bila tidak.
+    """
+    if not audio_bytes:
+        logger.error("TTS produced empty audio")
+        return "[ERROR] TTS created empty file"
     try:
-        # Atur encoding UTF-8 untuk subprocess
-        env = os.environ.copy()
-        env["PYTHONIOENCODING"] = "utf-8"
-        print(f"[INFO] Running TTS command: {' '.join(cmd)}")
-        result = subprocess.run(
-            cmd,
-            check=True,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            env=env
-        )
-        print(f"[INFO] TTS stdout: {result.stdout}")
-        
-        # Validasi file WAV benar-benar valid
-        if not os.path.exists(output_path):
-            print(f"[ERROR] TTS output file not created: {output_path}")
-            return "[ERROR] TTS failed to create output file"
-            
-        if os.path.getsize(output_path) == 0:
-            print(f"[ERROR] TTS output file is empty: {output_path}")
-            return "[ERROR] TTS created empty file"
-            
-        with wave.open(output_path, 'rb') as wav_file:
+        with wave.open(io.BytesIO(audio_bytes), 'rb') as wav_file:
             channels = wav_file.getnchannels()
             framerate = wav_file.getframerate()
             frames = wav_file.getnframes()
-            print(f"[INFO] Valid WAV: {channels} ch, {framerate} Hz, {frames} frames")
-            
+            logger.debug("Valid WAV: %d ch, %d Hz, %d frames", channels, framerate, frames)
+
             # Sanity check to make sure the file has actual audio content
             if frames < 100:  # Arbitrary small number to detect essentially empty files
-                print(f"[WARNING] WAV file has very few frames: {frames}")
-                
-    except subprocess.CalledProcessError as e:
-        print(f"[ERROR] TTS subprocess failed: {e}")
-        print(f"[ERROR] TTS stderr: {e.stderr}")
-        return "[ERROR] Failed to synthesize speech"
-    except wave.Error as e:
-        print(f"[ERROR] Invalid WAV file generated: {e}")
+                logger.warning("WAV file has very few frames: %s", frames)
+    except (wave.Error, EOFError) as e:
+        logger.error("Invalid WAV file generated: %s", e)
         return "[ERROR] Invalid WAV file"
-    except FileNotFoundError as e:
-        print(f"[ERROR] File not found during TTS: {e}")
-        return "[ERROR] File not found"
+    return ""
+
+def spool_speech_audio(audio_bytes: bytes) -> str:
+    """
+    Validasi audio WAV hasil sintesis (atau dari cache balasan) lalu simpan di audio spool.
+    Returns:
+        str: ID audio di spool, atau pesan "[ERROR] ..." bila gagal.
+    """
+    error = validate_wav(audio_bytes)
+    if error:
+        return error
+    try:
+        audio = audio_spool.put(audio_bytes)
     except Exception as e:
-        print(f"[ERROR] Unexpected error in TTS: {str(e)}")
+        logger.error("Unexpected error in TTS: %s", e)
         return f"[ERROR] {str(e)}"
-
-    print(f"[INFO] Output audio saved to: {output_path}")
-    return output_path
\ No newline at end of file
+    logger.debug("Output audio spooled as %s (%d bytes)", audio.id, audio.size)
+    return audio.id
@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+class TTSCache:
+    """
+    Cache audio TTS berbasis hash konten. Tier pertama LRU di memori, tier kedua
+    file di disk; keduanya dibatasi jumlah byte dan membuang entri terlama.
+    """
+
+    def __init__(self, directory: str, fingerprint: str, memory_bytes: int, disk_bytes: int):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.disk_bytes > 0:
+            self._scan_disk()
+
+    def _scan_disk(self):
+        # Muat ulang indeks tier disk dari run sebelumnya, urut dari yang paling lama dipakai
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                # Sisa penulisan yang terputus; yang masih baru mungkin sedang ditulis worker lain
+                try:
+                    if os.path.getmtime(path) < time.time() - 60:
+                        os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith(".wav"):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len(".wav")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+        self._evict_disk()
+
+    def key(self, text: str) -> str:
+        payload = f"{self.fingerprint}\n{normalize_text(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return audio
+            on_disk = key in self._disk
+
+        if on_disk:
+            try:
+                with open(self._path(key), "rb") as f:
+                    audio = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                audio = None
+            with self._lock:
+                if audio is not None:
+                    self._disk.move_to_end(key)
+                    self.disk_hits += 1
+                    self._put_memory(key, audio)
+                    return audio
+                # File hilang dari luar: buang dari indeks
+                size = self._disk.pop(key, None)
+                if size is not None:
+                    self._disk_size -= size
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, audio: bytes):
+        with self._lock:
+            self._put_memory(key, audio)
+            if self.disk_bytes <= 0 or len(audio) > self.disk_bytes or key in self._disk:
+                return
+
+        # Tulis ke file sementara lalu rename supaya pembaca tidak melihat file setengah jadi
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(audio)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning("Failed to write TTS cache entry: %s", e)
+            return
+
+        with self._lock:
+            if key not in self._disk:
+                self._disk[key] = len(audio)
+                self._disk_size += len(audio)
+            self._evict_disk()
+
+    def _put_memory(self, key: str, audio: bytes):
+        if self.memory_bytes <= 0 or len(audio) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= len(previous)
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _evict_disk(self):
+        while self._disk_size > self.disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_size,
+            }
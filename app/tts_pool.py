@@ -0,0 +1,443 @@
+import io
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import wave
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from app.metrics import TTS_BATCH_OCCUPANCY
+
+logger = logging.getLogger(__name__)
+
+
+class TTSError(RuntimeError):
+    pass
+
+
+def _wav_to_bytes(wav, sample_rate: int) -> bytes:
+    # Normalisasi seperti save_wav milik Coqui lalu tulis sebagai PCM 16-bit
+    wav = np.asarray(wav, dtype=np.float32)
+    wav_norm = wav * (32767 / max(0.01, float(np.max(np.abs(wav))) if wav.size else 0.01))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(wav_norm.astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+def _speaker_id(model, speaker: str):
+    manager = getattr(model, "speaker_manager", None)
+    if manager is None:
+        return None
+    names = getattr(manager, "name_to_id", None) or getattr(manager, "speaker_ids", None) or {}
+    return names[speaker]
+
+
+def _postprocess(synthesizer, waveform):
+    # Sama dengan Synthesizer.tts: buang hening di ujung kalimat bila config memintanya
+    audio_config = synthesizer.tts_config.audio
+    if "do_trim_silence" in audio_config and audio_config["do_trim_silence"]:
+        from TTS.tts.utils.synthesis import trim_silence
+
+        waveform = trim_silence(waveform, synthesizer.tts_model.ap)
+    return waveform
+
+
+def _infer_batch(synthesizer, sentences: list, speaker: str) -> list:
+    """
+    Satu forward pass VITS untuk beberapa kalimat sekaligus: token di-pad ke
+    panjang terpanjang, lalu waveform dipotong kembali sesuai panjang masing-masing.
+    """
+    import torch
+
+    model = synthesizer.tts_model
+    ids = [model.tokenizer.text_to_ids(sentence) for sentence in sentences]
+    lengths = torch.tensor([len(seq) for seq in ids], dtype=torch.long)
+    x = torch.zeros(len(ids), int(lengths.max()), dtype=torch.long)
+    for row, seq in enumerate(ids):
+        x[row, :len(seq)] = torch.tensor(seq, dtype=torch.long)
+
+    aux_input = {"x_lengths": lengths}
+    speaker_id = _speaker_id(model, speaker)
+    if speaker_id is not None:
+        aux_input["speaker_ids"] = torch.full((len(ids),), speaker_id, dtype=torch.long)
+
+    with torch.no_grad():
+        outputs = model.inference(x, aux_input=aux_input)
+    waveforms = outputs["model_outputs"].squeeze(1).cpu().numpy()
+    frames = outputs["y_mask"].sum(dim=(1, 2)).long() * model.config.audio.hop_length
+    return [waveform[:n] for waveform, n in zip(waveforms, frames.tolist())]
+
+
+def _synthesize_batch(synthesizer, texts: list, speaker: str) -> list:
+    """Sintesis banyak teks; hasilnya ("ok", wav bytes) atau ("error", pesan) per teks."""
+    sample_rate = synthesizer.output_sample_rate
+    if len(texts) > 1 and type(synthesizer.tts_model).__name__ == "Vits":
+        try:
+            # Pecah per kalimat seperti Synthesizer.tts, lalu semua kalimat diproses dalam satu batch
+            split = [synthesizer.split_into_sentences(text) for text in texts]
+            waveforms = iter(_infer_batch(synthesizer, [s for sentences in split for s in sentences], speaker))
+            results = []
+            for sentences in split:
+                wav = []
+                for _ in sentences:
+                    wav.extend(_postprocess(synthesizer, next(waveforms)).tolist())
+                    wav.extend([0] * 10000)  # Jeda antar kalimat, sama dengan Synthesizer.tts
+                results.append(("ok", _wav_to_bytes(wav, sample_rate)))
+            return results
+        except Exception as e:
+            logger.warning("Batched TTS inference failed, falling back to one by one: %s", e)
+
+    results = []
+    for text in texts:
+        try:
+            wav = synthesizer.tts(text, speaker_name=speaker)
+            results.append(("ok", _wav_to_bytes(wav, sample_rate)))
+        except Exception as e:
+            results.append(("error", str(e)))
+    return results
+
+
+def _load_synthesizer(model_path: str, config_path: str, mmap_weights: bool):
+    """
+    Muat Synthesizer Coqui. Dengan mmap_weights, checkpoint di-memory-map read-only dan
+    parameter model langsung memakai halaman file itu (load_state_dict assign=True), jadi
+    semua proses TTS di satu node berbagi bobot lewat page cache, bukan salinan masing-masing.
+    """
+    from TTS.utils.synthesizer import Synthesizer
+    if not mmap_weights:
+        return Synthesizer(tts_checkpoint=model_path, tts_config_path=config_path, use_cuda=False)
+
+    import torch
+    from TTS.config import load_config
+    from TTS.tts.models import setup_model
+
+    # Langkah yang sama dengan Synthesizer._load_tts, kecuali cara memuat bobot
+    config = load_config(config_path)
+    model = setup_model(config)
+    try:
+        state = torch.load(model_path, map_location="cpu", mmap=True, weights_only=False)
+    except RuntimeError as e:
+        # Checkpoint format lama (bukan zip) tidak bisa di-mmap
+        logger.warning("Cannot memory-map %s (%s), loading a private copy", model_path, e)
+        return Synthesizer(tts_checkpoint=model_path, tts_config_path=config_path, use_cuda=False)
+    model_state = {k: v for k, v in state["model"].items() if "speaker_encoder" not in k}
+    model.load_state_dict(model_state, assign=True)
+    model.eval()
+
+    synthesizer = Synthesizer()
+    synthesizer.tts_config = config
+    synthesizer.tts_model = model
+    synthesizer.output_sample_rate = config.audio["sample_rate"]
+    return synthesizer
+
+
+def _worker_main(conn, model_path: str, config_path: str, speaker: str,
+                 threads: int = 0, mmap_weights: bool = False):
+    """Loop proses worker: muat model Coqui sekali lalu layani request dari pipe."""
+    try:
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
+        synthesizer = _load_synthesizer(model_path, config_path, mmap_weights)
+    except Exception as e:
+        conn.send(("error", f"Failed to load Coqui model: {e}"))
+        return
+    conn.send(("ready", synthesizer.output_sample_rate))
+
+    while True:
+        try:
+            kind, payload = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        if kind == "stop":
+            break
+        if kind == "ping":
+            conn.send(("ok", None))
+            continue
+        if kind == "synthesize_batch":
+            conn.send(("ok", _synthesize_batch(synthesizer, payload, speaker)))
+            continue
+
+        try:
+            # payload bisa berupa fonem IPA hasil g2p atau teks biasa
+            wav = synthesizer.tts(payload, speaker_name=speaker)
+            conn.send(("ok", _wav_to_bytes(wav, synthesizer.output_sample_rate)))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class SynthesizerWorker:
+    """Satu proses Coqui TTS yang menyimpan model di memori."""
+
+    def __init__(self, ctx, worker_id: int, model_path: str, config_path: str, speaker: str,
+                 threads: int = 0, mmap_weights: bool = False):
+        self.ctx = ctx
+        self.worker_id = worker_id
+        self.args = (model_path, config_path, speaker)
+        self.threads = threads
+        self.mmap_weights = mmap_weights
+        self.process = None
+        self.conn = None
+
+    def start(self, timeout: float):
+        parent_conn, child_conn = self.ctx.Pipe()
+        self.process = self.ctx.Process(
+            target=_worker_main,
+            args=(child_conn, *self.args, self.threads, self.mmap_weights),
+            name=f"tts-worker-{self.worker_id}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+        if not self.conn.poll(timeout):
+            self.stop()
+            raise TTSError(f"TTS worker {self.worker_id} not ready after {timeout}s")
+        kind, payload = self.conn.recv()
+        if kind != "ready":
+            self.stop()
+            raise TTSError(payload)
+        logger.info("TTS worker %s ready (%s Hz)", self.worker_id, payload)
+
+    def stop(self):
+        if self.conn is not None:
+            try:
+                self.conn.send(("stop", None))
+            except (OSError, ValueError):
+                pass
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.kill()
+            self.process = None
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def request(self, kind: str, payload, timeout: float):
+        self.conn.send((kind, payload))
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"TTS worker {self.worker_id} did not answer within {timeout}s")
+        return self.conn.recv()
+
+
+class _PendingSynthesis:
+    """Satu request sintesis yang menunggu masuk batch."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.future = Future()
+        self.dispatched = threading.Event()
+        self.timeout = 0.0  # batas waktu setelah batch-nya dikirim ke worker
+
+
+class SynthesizerPool:
+    """
+    Pool proses Coqui TTS dengan health check dan restart otomatis saat crash.
+    Bila max_batch_size > 1, request yang datang berdekatan (dalam max_batch_wait
+    detik) digabung menjadi satu batch inferensi per worker.
+    """
+
+    def __init__(self, size: int, model_path: str, config_path: str, speaker: str,
+                 startup_timeout: float = 300, request_timeout: float = 120,
+                 health_interval: float = 30, max_batch_size: int = 1,
+                 max_batch_wait: float = 0.02, threads: int = 0,
+                 mmap_weights: bool = False):
+        ctx = multiprocessing.get_context("spawn")
+        self._workers = [
+            SynthesizerWorker(ctx, i, model_path, config_path, speaker, threads, mmap_weights)
+            for i in range(max(1, size))
+        ]
+        self._idle = queue.Queue()
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._stop_event = threading.Event()
+        self.startup_timeout = startup_timeout
+        self.request_timeout = request_timeout
+        self.health_interval = health_interval
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_wait = max_batch_wait
+
+    def set_threads(self, threads: int):
+        """Ubah jumlah thread torch per proses; berlaku untuk proses yang dimulai setelah ini."""
+        for worker in self._workers:
+            worker.threads = threads
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for worker in self._workers:
+                worker.start(self.startup_timeout)
+                self._idle.put(worker)
+            self._started = True
+            self._stop_event = threading.Event()
+            if self.health_interval > 0:
+                threading.Thread(
+                    target=self._monitor, args=(self._stop_event,), name="tts-health", daemon=True
+                ).start()
+            if self.max_batch_size > 1:
+                # Satu penyusun batch per worker agar semua worker tetap terisi
+                for i in range(len(self._workers)):
+                    threading.Thread(
+                        target=self._batch_loop, args=(self._stop_event,), name=f"tts-batch-{i}", daemon=True
+                    ).start()
+
+    def stop(self):
+        with self._lock:
+            self._stop_event.set()
+            for worker in self._workers:
+                worker.stop()
+            self._idle = queue.Queue()
+            self._started = False
+        while True:
+            try:
+                pending = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if pending.future.set_running_or_notify_cancel():
+                pending.future.set_exception(TTSError("TTS pool stopped"))
+            pending.dispatched.set()
+
+    def _restart(self, worker: SynthesizerWorker):
+        logger.warning("Restarting TTS worker %s", worker.worker_id)
+        worker.stop()
+        worker.start(self.startup_timeout)
+
+    def _request(self, kind: str, payload, timeout: float):
+        """Kirim satu request ke worker idle; restart dan coba sekali lagi bila worker crash."""
+        self.start()
+        worker = self._idle.get()
+        try:
+            for attempt in range(2):
+                if not worker.is_alive():
+                    self._restart(worker)
+                try:
+                    kind_out, result = worker.request(kind, payload, timeout)
+                except (EOFError, OSError, TimeoutError) as e:
+                    # Worker crash atau macet: restart lalu coba sekali lagi
+                    logger.error("TTS worker %s failed: %s", worker.worker_id, e)
+                    self._restart(worker)
+                    if attempt == 1:
+                        raise TTSError(f"TTS worker failed: {e}")
+                    continue
+                if kind_out != "ok":
+                    raise TTSError(result)
+                return result
+        finally:
+            self._idle.put(worker)
+
+    def synthesize(self, text: str) -> bytes:
+        """Sintesis teks (atau fonem) dan kembalikan isi file WAV."""
+        if self.max_batch_size == 1:
+            return self._request("synthesize", text, self.request_timeout)
+        self.start()
+        pending = _PendingSynthesis(text)
+        self._pending.put(pending)
+        # Di antrean cukup menunggu satu batch penuh di depannya pada worker yang sama
+        queue_timeout = self.max_batch_wait + self.request_timeout * self.max_batch_size
+        if not pending.dispatched.wait(queue_timeout) and pending.future.cancel():
+            raise TTSError(f"TTS request not scheduled within {queue_timeout:.1f}s")
+        pending.dispatched.wait()
+        try:
+            return pending.future.result(timeout=pending.timeout)
+        except FutureTimeoutError:
+            raise TTSError(f"TTS batch did not complete within {pending.timeout:.1f}s")
+
+    def synthesize_batch(self, texts: list) -> list:
+        """Sintesis beberapa teks dalam satu inferensi; hasilnya ("ok", wav) atau ("error", pesan) per teks."""
+        # Batas waktu dihitung seperti bila teks disintesis satu per satu
+        return self._request("synthesize_batch", list(texts), self.request_timeout * len(texts))
+
+    def _collect_batch(self, stop_event: threading.Event) -> list:
+        try:
+            batch = [self._pending.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_batch_wait
+        while len(batch) < self.max_batch_size and not stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _batch_loop(self, stop_event: threading.Event):
+        while not stop_event.is_set():
+            batch = self._collect_batch(stop_event)
+            # Batas waktu synthesize_batch, retry-nya, dan satu kali restart worker di antaranya
+            timeout = 2 * self.request_timeout * len(batch) + self.startup_timeout
+            for pending in batch:
+                pending.timeout = timeout
+            # Request yang sudah menyerah menunggu di antrean tidak ikut disintesis
+            batch = [pending for pending in batch if pending.future.set_running_or_notify_cancel()]
+            for pending in batch:
+                pending.dispatched.set()
+            if not batch:
+                continue
+            TTS_BATCH_OCCUPANCY.observe(len(batch) / self.max_batch_size)
+            try:
+                results = self.synthesize_batch([pending.text for pending in batch])
+            except Exception as e:
+                for pending in batch:
+                    pending.future.set_exception(e)
+                continue
+            for pending, (kind, payload) in zip(batch, results):
+                if kind == "ok":
+                    pending.future.set_result(payload)
+                else:
+                    pending.future.set_exception(TTSError(payload))
+
+    def warmup(self, text: str):
+        """Jalankan satu sintesis dummy di setiap worker."""
+        self.start()
+        workers = [self._idle.get() for _ in self._workers]
+        try:
+            for worker in workers:
+                kind, payload = worker.request("synthesize", text, self.request_timeout)
+                if kind != "ok":
+                    raise TTSError(payload)
+        finally:
+            for worker in workers:
+                self._idle.put(worker)
+
+    def health_check(self) -> bool:
+        """Ping setiap worker yang sedang idle dan restart yang tidak menjawab."""
+        healthy = True
+        for _ in range(len(self._workers)):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if not worker.is_alive() or worker.request("ping", None, 5)[0] != "ok":
+                    raise TTSError("no answer")
+            except Exception as e:
+                healthy = False
+                logger.warning("TTS worker %s failed health check: %s", worker.worker_id, e)
+                try:
+                    self._restart(worker)
+                except Exception as restart_error:
+                    logger.error("Failed to restart TTS worker %s: %s", worker.worker_id, restart_error)
+            finally:
+                self._idle.put(worker)
+        return healthy
+
+    def _monitor(self, stop_event: threading.Event):
+        while not stop_event.wait(self.health_interval):
+            self.health_check()
@@ -0,0 +1,56 @@
+import io
+import os
+import wave
+
+import numpy as np
+
+
+def synthetic_utterance(seconds: float, sample_rate: int = 16000, channels: int = 1,
+                        lead_silence: float = 0.3, seed: int = 0) -> bytes:
+    """
+    Buat WAV sintetis yang menyerupai ucapan: hening di awal/akhir, lalu
+    "suku kata" berupa nada termodulasi dengan sedikit noise latar.
+    """
+    rng = np.random.default_rng(seed)
+    total = int((seconds + 2 * lead_silence) * sample_rate)
+    t = np.arange(total) / sample_rate
+    signal = rng.normal(0, 1e-3, total)
+
+    start = int(lead_silence * sample_rate)
+    end = total - start
+    voiced_t = t[start:end]
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * voiced_t)
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * voiced_t)) ** 2 / 4
+    signal[start:end] += 0.3 * envelope * np.sin(2 * np.pi * np.cumsum(pitch) / sample_rate)
+
+    pcm = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+    if channels > 1:
+        pcm = np.repeat(pcm[:, None], channels, axis=1)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+# Variasi yang mewakili upload nyata: perintah singkat dari mic 16 kHz,
+# pertanyaan biasa dari browser 48 kHz stereo, dan pertanyaan panjang 44.1 kHz
+FIXTURES = {
+    "short_16k_mono": dict(seconds=1.5, sample_rate=16000, channels=1, seed=1),
+    "medium_48k_stereo": dict(seconds=4.0, sample_rate=48000, channels=2, seed=2),
+    "long_44k_mono": dict(seconds=10.0, sample_rate=44100, channels=1, seed=3),
+}
+
+
+def load_fixtures() -> dict:
+    return {name: synthetic_utterance(**params) for name, params in FIXTURES.items()}
+
+
+def write_fixtures(directory: str):
+    os.makedirs(directory, exist_ok=True)
+    for name, audio in load_fixtures().items():
+        with open(os.path.join(directory, f"{name}.wav"), "wb") as f:
+            f.write(audio)
@@ -0,0 +1,84 @@
+"""
+Server tiruan Gemini (REST generateContent dan streamGenerateContent) untuk pengujian
+lokal client LLM: latensi, request yang macet, dan error 503 bisa diatur.
+
+Contoh:
+    python -m bench.gemini_standin --port 8766 --latency 0.6 --stall-rate 0.05 --fail-rate 0.1
+lalu jalankan server dengan GEMINI_API_BASE=http://127.0.0.1:8766/v1beta
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def _reply_payload(text: str) -> dict:
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+
+def create_app(latency: float = 0.6, jitter: float = 0.2, stall_rate: float = 0.0,
+               stall_seconds: float = 30.0, fail_rate: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Gemini stand-in")
+    counter = itertools.count(1)
+    app.state.requests = 0
+
+    def delay() -> float:
+        if random.random() < stall_rate:
+            return stall_seconds
+        return latency * random.uniform(1 - jitter, 1 + jitter)
+
+    def next_reply() -> str:
+        n = next(counter)
+        return (
+            f"Hari ini cuacanya cerah di sebagian besar wilayah, jawaban nomor {n}. "
+            "Suhu sekitar 30 derajat dengan angin sepoi-sepoi."
+        )
+
+    @app.post("/v1beta/models/{target}")
+    async def generate(target: str, request: Request):
+        app.state.requests += 1
+        await request.json()
+        _, _, method = target.partition(":")
+        if random.random() < fail_rate:
+            return JSONResponse(status_code=503, content={"error": {"code": 503, "message": "overloaded"}})
+
+        reply = next_reply()
+        if method == "generateContent":
+            await asyncio.sleep(delay())
+            return _reply_payload(reply)
+
+        # streamGenerateContent?alt=sse: latensi dibagi ke beberapa potongan seperti stream token
+        chunks = [reply[i:i + 24] for i in range(0, len(reply), 24)]
+        total = delay()
+
+        async def events():
+            for chunk in chunks:
+                await asyncio.sleep(total / len(chunks))
+                yield f"data: {json.dumps(_reply_payload(chunk))}\r\n\r\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local Gemini stand-in server")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.6, help="Latensi jawaban (detik)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Variasi acak latensi (0-1)")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Peluang request macet")
+    parser.add_argument("--stall-seconds", type=float, default=30.0, help="Lama request yang macet")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Peluang jawaban HTTP 503")
+    args = parser.parse_args(argv)
+    app = create_app(args.latency, args.jitter, args.stall_rate, args.stall_seconds, args.fail_rate)
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
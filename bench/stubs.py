@@ -0,0 +1,97 @@
+"""
+Pengganti lokal untuk whisper-server dan Coqui dengan latensi yang bisa diatur.
+Stub dipasang di titik yang sama dengan engine asli (pool STT, pool TTS), sehingga
+decode audio, VAD, front-end g2p, dan seluruh alur FastAPI tetap ikut terukur.
+Gemini digantikan server tiruan di bench/gemini_standin.py.
+"""
+import io
+import random
+import threading
+import time
+import wave
+
+import numpy as np
+
+
+def _sleep(latency: float, jitter: float):
+    if latency > 0:
+        time.sleep(latency * random.uniform(1 - jitter, 1 + jitter))
+
+
+class StubWhisperPool:
+    """Meniru WhisperEnginePool: `size` engine, latensi = dasar + rtf x durasi audio."""
+
+    def __init__(self, size: int, latency: float, rtf: float, jitter: float):
+        self._slots = threading.Semaphore(max(1, size))
+        self.latency = latency
+        self.rtf = rtf
+        self.jitter = jitter
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def transcribe(self, wav_bytes: bytes) -> str:
+        with wave.open(io.BytesIO(wav_bytes), "rb") as wav_file:
+            seconds = wav_file.getnframes() / wav_file.getframerate()
+        with self._slots:
+            _sleep(self.latency + self.rtf * seconds, self.jitter)
+        return "Cuaca hari ini gimana?"
+
+    def warmup(self, wav_bytes: bytes):
+        self.transcribe(wav_bytes)
+
+
+class StubSynthesizerPool:
+    """Meniru SynthesizerPool: `size` worker, latensi = dasar + per karakter input."""
+
+    sample_rate = 22050
+
+    def __init__(self, size: int, latency: float, per_char: float, jitter: float):
+        self._slots = threading.Semaphore(max(1, size))
+        self.latency = latency
+        self.per_char = per_char
+        self.jitter = jitter
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def set_threads(self, threads: int):
+        pass
+
+    def health_check(self) -> bool:
+        return True
+
+    def warmup(self, text: str):
+        self.synthesize(text)
+
+    def synthesize(self, text: str) -> bytes:
+        with self._slots:
+            _sleep(self.latency + self.per_char * len(text), self.jitter)
+        # Kira-kira 60 ms audio per karakter, seperti kecepatan bicara normal
+        frames = int(self.sample_rate * 0.06 * max(1, len(text)))
+        t = np.arange(frames) / self.sample_rate
+        pcm = (0.2 * np.sin(2 * np.pi * 180 * t) * 32767).astype("<i2")
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.sample_rate)
+            wav_file.writeframes(pcm.tobytes())
+        return buffer.getvalue()
+
+
+def install_stubs(args):
+    """Ganti engine asli di modul app dengan stub sesuai argumen benchmark."""
+    import app.stt
+    import app.tts
+
+    app.stt.stt_pool = StubWhisperPool(args.stt_workers, args.stt_latency, args.stt_rtf, args.jitter)
+    # Tier cepat tidak di-stub; semua klip langsung ke pool stub
+    app.stt.fast_tiers = []
+    app.tts.tts_pool = StubSynthesizerPool(args.tts_workers, args.tts_latency, args.tts_per_char, args.jitter)
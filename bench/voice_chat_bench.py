@@ -0,0 +1,252 @@
+"""
+Benchmark end-to-end /voice-chat dengan engine stub.
+
+Contoh:
+    python -m bench.voice_chat_bench --concurrency 1,4,16 --requests 64 --output bench_results.json
+
+Hasil berupa JSON (throughput serta p50/p95/p99 latensi total dan per tahap untuk
+setiap tingkat concurrency) sehingga bisa dibandingkan antar versi.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load benchmark for /voice-chat with stub engines")
+    parser.add_argument("--concurrency", default="1,4,16", help="Daftar tingkat concurrency, dipisah koma")
+    parser.add_argument("--requests", type=int, default=64, help="Jumlah request per tingkat concurrency")
+    parser.add_argument("--warmup", type=int, default=4, help="Request pemanasan sebelum pengukuran")
+    parser.add_argument("--response-format", choices=["json", "wav"], default="json")
+    parser.add_argument("--sessions", type=int, default=0,
+                        help="Jumlah session id berbeda (0 = satu sesi per request)")
+    parser.add_argument("--stt-latency", type=float, default=0.15, help="Latensi dasar STT (detik)")
+    parser.add_argument("--stt-rtf", type=float, default=0.05, help="Detik STT per detik audio")
+    parser.add_argument("--llm-latency", type=float, default=0.6, help="Latensi Gemini (detik)")
+    parser.add_argument("--llm-stall-rate", type=float, default=0.0, help="Peluang request Gemini macet")
+    parser.add_argument("--llm-stall-seconds", type=float, default=30.0, help="Lama request Gemini yang macet")
+    parser.add_argument("--llm-fail-rate", type=float, default=0.0, help="Peluang Gemini menjawab HTTP 503")
+    parser.add_argument("--tts-latency", type=float, default=0.1, help="Latensi dasar TTS (detik)")
+    parser.add_argument("--tts-per-char", type=float, default=0.002, help="Detik TTS per karakter")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Variasi acak latensi stub (0-1)")
+    parser.add_argument("--stt-workers", type=int, default=int(os.getenv("STT_POOL_SIZE", "1")))
+    parser.add_argument("--tts-workers", type=int, default=int(os.getenv("TTS_POOL_SIZE", "1")))
+    parser.add_argument("--tts-cache", action="store_true", help="Aktifkan cache TTS (default dimatikan)")
+    parser.add_argument("--llm-cache", action="store_true", help="Aktifkan cache balasan LLM (default dimatikan)")
+    parser.add_argument("--single-flight", action="store_true",
+                        help="Aktifkan penggabungan upload identik (default dimatikan)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-port", type=int, default=8766, help="Port server tiruan Gemini")
+    parser.add_argument("--output", help="Tulis hasil JSON ke file ini (default: stdout)")
+    parser.add_argument("--write-fixtures", metavar="DIR", help="Simpan fixture WAV sintetis lalu keluar")
+    return parser.parse_args(argv)
+
+
+def _prepare_environment(args, workdir: str):
+    # Harus dipanggil sebelum modul app diimpor supaya state benchmark terisolasi
+    os.environ["SESSION_DB_FILE"] = os.path.join(workdir, "sessions.db")
+    os.environ["TTS_CACHE_DIR"] = os.path.join(workdir, "tts_cache")
+    if not args.tts_cache:
+        os.environ["TTS_CACHE_MEMORY_BYTES"] = "0"
+        os.environ["TTS_CACHE_DISK_BYTES"] = "0"
+    if not args.llm_cache:
+        # Stub STT selalu menghasilkan transcript yang sama, jadi tanpa ini semua request jadi cache hit
+        os.environ["LLM_CACHE_MAX_ENTRIES"] = "0"
+    if not args.single_flight:
+        # Fixture yang sama dikirim berulang untuk sesi yang sama bila --sessions dipakai
+        os.environ["SINGLE_FLIGHT_ENABLED"] = "0"
+    os.environ["GEMINI_API_BASE"] = f"http://127.0.0.1:{args.llm_port}/v1beta"
+    os.environ.setdefault("STT_EXECUTOR_WORKERS", str(args.stt_workers))
+    os.environ.setdefault("TTS_EXECUTOR_WORKERS", str(args.tts_workers))
+
+
+def _start_server(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def _wait_for_engines():
+    # Tunggu warmup engine selesai agar pengukuran tidak ikut menghitung load model
+    from app.engines import engine_status, engines_ready
+    while not engines_ready():
+        failed = {name: status for name, status in engine_status().items() if status["state"] == "failed"}
+        if failed:
+            raise RuntimeError(f"Engine warmup failed: {failed}")
+        time.sleep(0.05)
+
+
+def _summary(values) -> dict:
+    if not values:
+        return {}
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+def _parse_server_timing(header: str) -> dict:
+    timings = {}
+    for item in filter(None, (part.strip() for part in header.split(","))):
+        name, _, duration = item.partition(";dur=")
+        if duration:
+            timings[f"{name}_ms"] = float(duration)
+    return timings
+
+
+async def _one_request(client, url: str, fixture, session_id: str, response_format: str) -> dict:
+    name, audio = fixture
+    data = {"session_id": session_id, "response_format": response_format}
+    start = time.perf_counter()
+    response = await client.post(url, files={"file": (f"{name}.wav", audio, "audio/wav")}, data=data)
+    total_ms = (time.perf_counter() - start) * 1000
+
+    result = {"fixture": name, "status": response.status_code, "total_ms": total_ms, "timings": {}}
+    if response.status_code == 200:
+        if response_format == "json":
+            result["timings"] = response.json().get("timings", {})
+        else:
+            result["timings"] = _parse_server_timing(response.headers.get("server-timing", ""))
+    return result
+
+
+async def _run_level(client, url: str, fixtures: list, concurrency: int, total: int, args, session_ids) -> dict:
+    counter = itertools.count()
+    results = []
+
+    async def worker():
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            fixture = fixtures[i % len(fixtures)]
+            results.append(await _one_request(client, url, fixture, next(session_ids), args.response_format))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+
+    ok = [r for r in results if r["status"] == 200]
+    stages = sorted({stage for r in ok for stage in r["timings"]})
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(ok) / duration, 3) if duration else 0.0,
+        "latency_ms": {
+            "total": _summary([r["total_ms"] for r in ok]),
+            **{stage[:-len("_ms")]: _summary([r["timings"][stage] for r in ok if stage in r["timings"]])
+               for stage in stages},
+        },
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def _run(args) -> dict:
+    import httpx
+
+    from bench.fixtures import load_fixtures
+
+    fixtures = list(load_fixtures().items())
+    url = f"http://127.0.0.1:{args.port}/voice-chat"
+    if args.sessions > 0:
+        session_ids = itertools.cycle([f"bench-{i}" for i in range(args.sessions)])
+    else:
+        session_ids = (f"bench-{i}" for i in itertools.count())
+
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        if args.warmup:
+            await _run_level(client, url, fixtures, 1, args.warmup, args, session_ids)
+        results = []
+        for level in levels:
+            result = await _run_level(client, url, fixtures, level, args.requests, args, session_ids)
+            print(
+                f"[BENCH] c={level:<3} {result['throughput_rps']:>7.2f} req/s  "
+                f"p50={result['latency_ms']['total'].get('p50')} ms  "
+                f"p99={result['latency_ms']['total'].get('p99')} ms  errors={result['errors']}",
+                file=sys.stderr,
+            )
+            results.append(result)
+
+    return {
+        "meta": {
+            "git_revision": _git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "write_fixtures")},
+            "fixtures": [name for name, _ in fixtures],
+        },
+        "levels": results,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.write_fixtures:
+        from bench.fixtures import write_fixtures
+        write_fixtures(args.write_fixtures)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="voice_bench_") as workdir:
+        _prepare_environment(args, workdir)
+
+        from bench.stubs import install_stubs
+        install_stubs(args)
+
+        from bench.gemini_standin import create_app
+        standin = create_app(args.llm_latency, args.jitter, args.llm_stall_rate, args.llm_stall_seconds, args.llm_fail_rate)
+        servers = [_start_server(standin, args.llm_port)]
+
+        import app.main
+        try:
+            servers.append(_start_server(app.main.app, args.port))
+            _wait_for_engines()
+            report = asyncio.run(_run(args))
+        finally:
+            for server, thread in reversed(servers):
+                server.should_exit = True
+                thread.join(timeout=10)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"[BENCH] Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,134 @@
+import io
 import os
-import tempfile
+import json
+import uuid
+import logging
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 import gradio as gr
 import scipy.io.wavfile
 import base64
+from urllib.parse import unquote
 
-def voice_chat(audio):
-    if audio is None:
-        return None, "Error: Tidak ada audio yang direkam.", None
-    
+logger = logging.getLogger(__name__)
+
+# Mode streaming: audio balasan diputar per kalimat begitu siap
+VOICE_CHAT_STREAMING = os.getenv("VOICE_CHAT_STREAMING", "1") == "1"
+
+# Alamat backend FastAPI dan batas waktu per request (detik)
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000").rstrip("/")
+BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", "120"))
+
+# Jumlah pengguna yang diproses bersamaan dan panjang antrean Gradio (0 = tanpa batas)
+GRADIO_CONCURRENCY_LIMIT = int(os.getenv("GRADIO_CONCURRENCY_LIMIT", "16"))
+GRADIO_MAX_QUEUE_SIZE = int(os.getenv("GRADIO_MAX_QUEUE_SIZE", "0"))
+
+# Satu session HTTP keep-alive untuk semua pengguna, pool koneksinya seukuran concurrency
+http_session = requests.Session()
+http_session.mount(
+    BACKEND_URL,
+    HTTPAdapter(pool_connections=1, pool_maxsize=max(1, GRADIO_CONCURRENCY_LIMIT)),
+)
+
+def _encode_recording(audio) -> bytes:
+    """Ubah rekaman numpy dari Gradio menjadi WAV 16-bit mono di memori."""
     sr, audio_data = audio
+    audio_data = np.asarray(audio_data)
+    if np.issubdtype(audio_data.dtype, np.floating):
+        scale = 32767.0
+    elif audio_data.dtype == np.int32:
+        scale = 1 / 65536
+    else:
+        scale = 1.0
+    if audio_data.ndim > 1:
+        # Stereo -> mono; dirata-rata dalam float agar tidak overflow
+        audio_data = audio_data.astype(np.float32).mean(axis=1)
+    if scale != 1.0 or audio_data.dtype != np.int16:
+        audio_data = np.clip(audio_data * scale, -32768, 32767).astype(np.int16)
+
+    buffer = io.BytesIO()
+    scipy.io.wavfile.write(buffer, sr, audio_data)
+    return buffer.getvalue()
+
+def _error_message(response) -> str:
+    try:
+        return response.json().get("error", f"Request failed with status {response.status_code}")
+    except ValueError:
+        return f"Request failed with status {response.status_code}"
+
+def _iter_sse(response):
+    # Parser Server-Sent Events sederhana: hasilkan (nama_event, data_json)
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
 
-    # Simpan sebagai .wav
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmpfile:
-        scipy.io.wavfile.write(tmpfile.name, sr, audio_data)
-        audio_path = tmpfile.name
+def voice_chat_stream(audio, session_id=None):
+    """
+    Kirim rekaman ke /voice-chat/stream dan hasilkan event secara bertahap:
+    ("transcript", teks), ("audio", (sr, data, kalimat)), atau ("error", pesan).
+    """
+    try:
+        files = {"file": ("voice.wav", _encode_recording(audio), "audio/wav")}
+        data = {"session_id": session_id} if session_id else None
+        with http_session.post(
+            f"{BACKEND_URL}/voice-chat/stream", files=files, data=data, stream=True, timeout=BACKEND_TIMEOUT
+        ) as response:
+            if response.status_code != 200:
+                yield "error", _error_message(response)
+                return
+            for event, payload in _iter_sse(response):
+                if event == "transcript":
+                    yield "transcript", payload.get("transcript", "")
+                elif event == "audio":
+                    sr, audio_data = scipy.io.wavfile.read(io.BytesIO(base64.b64decode(payload["audio"])))
+                    yield "audio", (sr, audio_data, payload.get("text", ""))
+                elif event == "error":
+                    yield "error", payload.get("error", "Unknown error")
+                    return
+    except Exception as e:
+        logger.error("Failed to process request: %s", e)
+        yield "error", f"Gagal memproses permintaan: {str(e)}"
+
+def voice_chat(audio, session_id=None):
+    """
+    Kirim rekaman ke /voice-chat (mode wav).
+    Returns:
+        tuple: ((sr, data) audio balasan di memori atau None, transcript, response text)
+    """
+    if audio is None:
+        return None, "Error: Tidak ada audio yang direkam.", None
 
     # Kirim ke endpoint FastAPI
     try:
-        with open(audio_path, "rb") as f:
-            files = {"file": ("voice.wav", f, "audio/wav")}
-            response = requests.post("http://localhost:8000/voice-chat", files=files)
-        
-        print(f"[DEBUG] Response status code: {response.status_code}")
-        print(f"[DEBUG] Response content: {response.text}")
-        
+        files = {"file": ("voice.wav", _encode_recording(audio), "audio/wav")}
+        data = {"response_format": "wav"}
+        if session_id:
+            data["session_id"] = session_id
+        response = http_session.post(f"{BACKEND_URL}/voice-chat", files=files, data=data, timeout=BACKEND_TIMEOUT)
+
+        logger.debug("Response status code: %s", response.status_code)
+
         if response.status_code == 200:
-            # Parse JSON response
-            data = response.json()
-            audio_base64 = data.get("audio")
-            audio_filename = data.get("audio_filename", "response.wav")
-            transcript = data.get("transcript", "Error: Transkrip tidak tersedia")
-            response_text = data.get("response_text", "Error: Respons teks tidak tersedia")
-            
-            # Simpan file audio dari base64
-            output_audio_path = os.path.join(tempfile.gettempdir(), audio_filename)
-            with open(output_audio_path, "wb") as f:
-                f.write(base64.b64decode(audio_base64))
-            
-            return output_audio_path, transcript, response_text
+            # Body berisi audio/wav langsung, teks dibawa lewat header
+            transcript = unquote(response.headers.get("X-Transcript", "Error: Transkrip tidak tersedia"))
+            response_text = unquote(response.headers.get("X-Response-Text", "Error: Respons teks tidak tersedia"))
+
+            # Audio tetap di memori per request; Gradio menyimpan sendiri ke cache miliknya
+            sr, audio_data = scipy.io.wavfile.read(io.BytesIO(response.content))
+            return (sr, audio_data), transcript, response_text
         else:
-            error_msg = response.json().get("error", f"Request failed with status {response.status_code}")
+            error_msg = _error_message(response)
             return None, f"Error: {error_msg}", f"Error: {error_msg}"
     except Exception as e:
-        print(f"[ERROR] Failed to process request: {e}")
+        logger.error("Failed to process request: %s", e)
         return None, f"Error: Gagal memproses permintaan: {str(e)}", f"Error: Gagal memproses permintaan: {str(e)}"
 
 # Custom CSS dengan nuansa cute dan font Poppins
@@ -204,6 +289,8 @@ with gr.Blocks(theme=gr.themes.Soft(), css=custom_css) as demo:
             gr.Markdown("### 🎧 Dengar Jawabannya")
             audio_output = gr.Audio(
                 type="filepath",
+                streaming=VOICE_CHAT_STREAMING,
+                autoplay=VOICE_CHAT_STREAMING,
                 label="🔊 Balasan suara dari asisten! 🎵",
                 interactive=False,
                 waveform_options={"show_controls": True, "waveform_color": "#a2d2ff"}
@@ -217,12 +304,16 @@ with gr.Blocks(theme=gr.themes.Soft(), css=custom_css) as demo:
     
     status_message = gr.Markdown("", visible=False, elem_classes="error-message")
     
+    # Setiap pengunjung mendapat session id sendiri agar percakapannya terpisah
+    session_state = gr.State(lambda: str(uuid.uuid4()))
+    
     def clear_inputs():
         return None, "", None, "", ""
     
-    def process_audio(audio):
+    def process_audio(audio, session_id):
         if audio is None:
-            return None, "Silakan rekam suara terlebih dahulu!", None, "⚠️ Silakan rekam suara terlebih dahulu!"
+            yield None, "Silakan rekam suara terlebih dahulu!", None, "⚠️ Silakan rekam suara terlebih dahulu!"
+            return
         
         # Tampilkan pesan sedang diproses
         status_message_content = """
@@ -231,17 +322,33 @@ with gr.Blocks(theme=gr.themes.Soft(), css=custom_css) as demo:
         </div>
         """
         
+        if VOICE_CHAT_STREAMING:
+            # Putar audio kalimat pertama segera, kalimat berikutnya menyusul
+            transcript, response_text = "", ""
+            for event, payload in voice_chat_stream(audio, session_id):
+                if event == "transcript":
+                    transcript = payload
+                    yield gr.update(), transcript, "", ""
+                elif event == "audio":
+                    sr, audio_data, sentence = payload
+                    response_text = f"{response_text} {sentence}".strip()
+                    yield (sr, audio_data), transcript, response_text, ""
+                else:
+                    yield gr.update(), transcript or f"Error: {payload}", f"Error: {payload}", f"⚠️ {payload}"
+                    return
+            return
+        
         # Proses audio
-        audio_path, transcript, response_text = voice_chat(audio)
+        reply_audio, transcript, response_text = voice_chat(audio, session_id)
         
-        if audio_path:
-            return audio_path, transcript, response_text, ""
+        if reply_audio is not None:
+            yield reply_audio, transcript, response_text, ""
         else:
-            return None, transcript, response_text, f"⚠️ {transcript}"
+            yield None, transcript, response_text, f"⚠️ {transcript}"
     
     submit_btn.click(
         fn=process_audio,
-        inputs=audio_input,
+        inputs=[audio_input, session_state],
         outputs=[audio_output, transcript_output, response_text_output, status_message],
         show_progress="full",
         queue=True
@@ -261,4 +368,8 @@ with gr.Blocks(theme=gr.themes.Soft(), css=custom_css) as demo:
         """
     )
 
+demo.queue(
+    default_concurrency_limit=GRADIO_CONCURRENCY_LIMIT,
+    max_size=GRADIO_MAX_QUEUE_SIZE or None,
+)
 demo.launch()
\ No newline at end of file
@@ -0,0 +1,75 @@
+import asyncio
+
+import app.llm as llm
+from app.context_window import ConversationWindow, estimate_tokens
+from app.session_store import SessionStore
+
+
+def _turns(count: int, words: int = 1) -> list:
+    history = []
+    for i in range(count):
+        history.append({"role": "user", "parts": [f"tanya {i} " + "kata " * words]})
+        history.append({"role": "model", "parts": [f"jawab {i} " + "kata " * words]})
+    return history
+
+
+def test_window_keeps_last_turns():
+    window = ConversationWindow(_turns(5))
+    message = {"role": "user", "parts": ["baru"]}
+    messages = window.build(message, max_turns=2, token_budget=10000)
+    assert messages == window.history[-4:] + [message]
+
+
+def test_window_respects_token_budget_but_keeps_one_turn():
+    window = ConversationWindow(_turns(3, words=100))
+    turn_tokens = estimate_tokens(" ".join(window.history[-2]["parts"])) + \
+        estimate_tokens(" ".join(window.history[-1]["parts"]))
+    assert window.window_start(max_turns=10, token_budget=turn_tokens + 1) == 4
+    # Satu giliran terakhir selalu ikut walau melebihi anggaran
+    assert window.window_start(max_turns=10, token_budget=1) == 4
+
+
+def test_window_never_reaches_into_summarized_messages():
+    window = ConversationWindow(_turns(4), summary="ringkasan", summarized_count=6)
+    assert window.window_start(max_turns=10, token_budget=10000) == 6
+    assert "ringkasan" in window.system_instruction("base")
+    assert ConversationWindow([]).system_instruction("base") == "base"
+
+
+def test_window_starts_with_user_message():
+    history = [{"role": "model", "parts": ["sisa"]}] + _turns(1)
+    window = ConversationWindow(history)
+    assert window.window_start(max_turns=10, token_budget=10000) == 1
+
+
+class _FakeGemini:
+    def __init__(self):
+        self.prompts = []
+
+    async def generate(self, contents, system_instruction=None):
+        self.prompts.append(contents[0]["parts"][0]["text"])
+        return f"ringkasan {len(self.prompts)}"
+
+
+def test_turns_outside_window_roll_up_into_summary(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm, "session_store", SessionStore(str(tmp_path / "sessions.db")))
+    monkeypatch.setattr(llm, "LLM_CONTEXT_MAX_TURNS", 2)
+    monkeypatch.setattr(llm, "LLM_CONTEXT_TOKEN_BUDGET", 10000)
+    gemini = _FakeGemini()
+    window = ConversationWindow(_turns(4))
+
+    async def main():
+        llm._schedule_summary(gemini, "s1", window)
+        await asyncio.gather(*llm._background_tasks)
+        window.history.extend(_turns(1))
+        llm._schedule_summary(gemini, "s1", window)
+        await asyncio.gather(*llm._background_tasks)
+
+    asyncio.run(main())
+    # Giliran yang keluar dari jendela dilipat bertahap, ringkasan sebelumnya ikut dikirim
+    assert window.summarized_count == 6
+    assert window.summary == "ringkasan 2"
+    assert "tanya 0" in gemini.prompts[0] and "tanya 2" not in gemini.prompts[0]
+    assert "ringkasan 1" in gemini.prompts[1] and "tanya 2" in gemini.prompts[1]
+    assert llm.session_store.load_summary("s1") == ("ringkasan 2", 6)
+    assert not window.summarizing
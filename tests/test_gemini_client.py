@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.gemini_client import GeminiClient, GeminiError, RetryableGeminiError
+
+
+def _answer(text: str) -> dict:
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+def _client(handler, **kwargs) -> GeminiClient:
+    options = dict(deadline=2, attempt_timeout=1, max_retries=2, retry_backoff=0.01)
+    options.update(kwargs)
+    client = GeminiClient("key", "model", "http://gemini.test", **options)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def _run(client: GeminiClient, coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await client.aclose()
+
+    return asyncio.run(main())
+
+
+def test_generate_sends_system_instruction():
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json=_answer("Halo"))
+
+    client = _client(handler)
+    assert _run(client, client.generate([{"role": "user", "parts": [{"text": "hai"}]}], "sopan")) == "Halo"
+    assert requests[0]["systemInstruction"] == {"parts": [{"text": "sopan"}]}
+
+
+def test_transient_errors_are_retried():
+    statuses = [503, 429, 200]
+
+    def handler(request):
+        status = statuses.pop(0)
+        return httpx.Response(status, json=_answer("ok") if status == 200 else {"error": "busy"})
+
+    client = _client(handler)
+    assert _run(client, client.generate([])) == "ok"
+    assert statuses == []
+
+
+def test_retries_are_limited():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        raise httpx.ConnectError("refused", request=request)
+
+    client = _client(handler, max_retries=1)
+    with pytest.raises(RetryableGeminiError):
+        _run(client, client.generate([]))
+    assert len(calls) == 2
+
+
+def test_client_errors_are_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(400, json={"error": "bad request"})
+
+    client = _client(handler)
+    with pytest.raises(GeminiError, match="HTTP 400"):
+        _run(client, client.generate([]))
+    assert len(calls) == 1
+
+
+def test_deadline_covers_all_attempts():
+    async def handler(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200, json=_answer("telat"))
+
+    client = _client(handler, deadline=0.2)
+    with pytest.raises(asyncio.TimeoutError):
+        _run(client, client.generate([]))
+
+
+def test_hedged_request_wins_when_first_is_slow():
+    delays = [1.0, 0.0]
+
+    async def handler(request):
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return httpx.Response(200, json=_answer(f"after {delay}"))
+
+    client = _client(handler, hedge_after=0.05)
+    assert _run(client, client.generate([])) == "after 0.0"
+
+
+def test_stream_yields_chunks():
+    def handler(request):
+        body = "".join(f"data: {json.dumps(_answer(text))}\n\n" for text in ("Halo ", "dunia."))
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    client = _client(handler)
+
+    async def collect():
+        return [chunk async for chunk in client.stream([])]
+
+    assert _run(client, collect()) == ["Halo ", "dunia."]
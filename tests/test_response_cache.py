@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import app.llm as llm
+from app.context_window import ConversationWindow
+from app.response_cache import ResponseCache, normalize_query
+from app.session_store import SessionStore
+
+TURN = [{"role": "user", "parts": ["Cuaca hari ini gimana?"]}, {"role": "model", "parts": ["Cerah."]}]
+
+
+def test_normalize_query_ignores_case_and_punctuation():
+    assert normalize_query("Cuaca hari ini gimana?") == normalize_query("cuaca  hari ini, GIMANA")
+
+
+def test_key_depends_on_context_and_namespace():
+    cache = ResponseCache(8, 60, namespace="model-a")
+    key = cache.key("Cuaca hari ini?", [])
+    assert key == cache.key("cuaca hari ini", [])
+    assert key != cache.key("Cuaca hari ini?", TURN)
+    assert key != ResponseCache(8, 60, namespace="model-b").key("Cuaca hari ini?", [])
+
+
+def test_put_get_and_audio():
+    cache = ResponseCache(8, 60)
+    key = cache.key("Cuaca?", [])
+    assert cache.get(key) is None
+    cache.put(key, "Cerah.", TURN)
+    assert cache.get(key)["response_text"] == "Cerah."
+    assert cache.get_audio(key) is None
+    cache.attach_audio(key, b"wav")
+    assert cache.get_audio(key) == b"wav"
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_ratio": 0.5, "entries": 1, "entries_with_audio": 1}
+
+
+def test_disabled_cache_stores_nothing():
+    for cache in (ResponseCache(0, 60), ResponseCache(8, 0)):
+        assert not cache.enabled
+        key = cache.key("Cuaca?", [])
+        cache.put(key, "Cerah.", TURN)
+        assert cache.get(key) is None
+
+
+def test_entries_expire_and_lru_is_bounded():
+    cache = ResponseCache(2, 0.1)
+    keys = [cache.key(f"tanya {i}", []) for i in range(3)]
+    for key in keys:
+        cache.put(key, "jawab", TURN)
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) is not None
+    time.sleep(0.15)
+    assert cache.get(keys[2]) is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_lookup_bypass_hit_and_context(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm, "session_store", SessionStore(str(tmp_path / "sessions.db")))
+    monkeypatch.setattr(llm, "response_cache", ResponseCache(8, 60))
+    window = ConversationWindow([])
+    llm.response_cache.put(llm._cache_key("Cuaca?", window.history), "Cerah.", TURN)
+
+    async def lookup(use_cache):
+        info = {}
+        _, cached = await llm._lookup_cache("cuaca", "s1", window, info, use_cache)
+        return info["cache"], cached
+
+    assert asyncio.run(lookup(False)) == ("bypass", None)
+    assert window.history == []
+    status, cached = asyncio.run(lookup(True))
+    assert (status, cached["response_text"]) == ("hit", "Cerah.")
+    # Giliran dari cache masuk riwayat, jadi pertanyaan yang sama kini punya konteks lain
+    assert window.history == TURN
+    assert llm.session_store.load("s1") == TURN
+    assert asyncio.run(lookup(True)) == ("miss", None)
@@ -0,0 +1,64 @@
+import threading
+
+from app.session_store import SessionStore
+
+MESSAGES = [
+    {"role": "user", "parts": ["Halo"]},
+    {"role": "model", "parts": ["Halo juga, ada yang bisa dibantu?"]},
+]
+
+
+def test_append_and_load_per_session(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    store.append("a", MESSAGES)
+    store.append("b", MESSAGES[:1])
+    store.append("a", [{"role": "user", "parts": ["Cuaca hari ini?"]}])
+    assert store.load("a") == MESSAGES + [{"role": "user", "parts": ["Cuaca hari ini?"]}]
+    assert store.load("a", offset=2) == [{"role": "user", "parts": ["Cuaca hari ini?"]}]
+    assert store.load("b") == MESSAGES[:1]
+    assert store.load("c") == []
+
+
+def test_uses_wal_and_is_shared_between_stores(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path)
+    assert store._connect().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    store.append("a", MESSAGES)
+    # Store lain pada file yang sama (worker lain) langsung melihat giliran baru
+    assert SessionStore(path).load("a") == MESSAGES
+
+
+def test_summary_round_trip(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    assert store.load_summary("a") == ("", 0)
+    store.save_summary("a", "ringkasan lama", 2)
+    store.save_summary("a", "ringkasan baru", 4)
+    assert store.load_summary("a") == ("ringkasan baru", 4)
+
+
+def test_append_if_empty_only_fills_empty_session(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    assert not store.append_if_empty("a", [])
+    assert store.append_if_empty("a", MESSAGES)
+    assert not store.append_if_empty("a", MESSAGES)
+    assert store.load("a") == MESSAGES
+
+
+def test_concurrent_legacy_migration_writes_once(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    SessionStore(path)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def migrate():
+        store = SessionStore(path)
+        barrier.wait()
+        results.append(store.append_if_empty("default", MESSAGES))
+
+    threads = [threading.Thread(target=migrate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
+    assert SessionStore(path).load("default") == MESSAGES
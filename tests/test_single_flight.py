@@ -0,0 +1,148 @@
+import asyncio
+
+from app.single_flight import SingleFlight
+
+
+def test_key_separates_parts():
+    assert SingleFlight.key("ab", "c") != SingleFlight.key("a", "bc")
+    assert SingleFlight.key("a", b"b") == SingleFlight.key("a", "b")
+
+
+def test_concurrent_callers_join_one_run():
+    async def main():
+        flight = SingleFlight(ttl=10, max_entries=8)
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"answer": 42}
+
+        results = await asyncio.gather(*(flight.run("k", work) for _ in range(3)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(role for _, role in results) == ["executed", "joined", "joined"]
+    assert all(result == {"answer": 42} for result, _ in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_recent_result_is_reused_until_ttl_or_bypass():
+    async def main():
+        flight = SingleFlight(ttl=0.1, max_entries=8)
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return len(calls)
+
+        roles = [(await flight.run("k", work))[1]]
+        roles.append((await flight.run("k", work))[1])
+        roles.append((await flight.run("k", work, reuse_recent=False))[1])
+        await asyncio.sleep(0.15)
+        roles.append((await flight.run("k", work))[1])
+        return roles, calls
+
+    roles, calls = asyncio.run(main())
+    assert roles == ["executed", "recent", "executed", "executed"]
+    assert len(calls) == 3
+
+
+def test_errors_reach_every_caller_and_are_not_remembered():
+    async def main():
+        flight = SingleFlight(ttl=10, max_entries=8)
+        calls = []
+
+        async def fail():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(*(flight.run("k", fail) for _ in range(2)), return_exceptions=True)
+        retry = await asyncio.gather(flight.run("k", fail), return_exceptions=True)
+        return results + retry, calls
+
+    results, calls = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(calls) == 2
+
+
+def test_keep_rejects_result_from_recent():
+    async def main():
+        flight = SingleFlight(ttl=10, max_entries=8)
+
+        async def work():
+            return {"error": "bad"}
+
+        keep = lambda result: "error" not in result
+        first = await flight.run("k", work, keep=keep)
+        second = await flight.run("k", work, keep=keep)
+        return first[1], second[1]
+
+    assert asyncio.run(main()) == ("executed", "executed")
+
+
+def test_stream_subscribers_replay_all_events():
+    async def main():
+        flight = SingleFlight(ttl=10, max_entries=8)
+        runs = []
+
+        async def events():
+            runs.append(1)
+            for i in range(3):
+                await asyncio.sleep(0.01)
+                yield i
+
+        async def consume():
+            iterator, role = flight.stream("k", events)
+            return [item async for item in iterator], role
+
+        first = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.015)
+        joined = await consume()
+        recent = await consume()
+        return await first, joined, recent, runs
+
+    first, joined, recent, runs = asyncio.run(main())
+    assert first == ([0, 1, 2], "executed")
+    assert joined == ([0, 1, 2], "joined")
+    assert recent == ([0, 1, 2], "recent")
+    assert len(runs) == 1
+
+
+def test_stream_is_cancelled_when_every_subscriber_leaves():
+    async def main():
+        flight = SingleFlight(ttl=10, max_entries=8)
+        cancelled = asyncio.Event()
+
+        async def events():
+            try:
+                yield "first"
+                await asyncio.sleep(10)
+                yield "never"
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        iterator, _ = flight.stream("k", events)
+        assert await iterator.__anext__() == "first"
+        await iterator.aclose()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return flight.stats()
+
+    stats = asyncio.run(main())
+    assert stats["in_flight"] == 0
+    assert stats["recent"] == 0
+
+
+def test_disabled_always_executes():
+    async def main():
+        flight = SingleFlight(ttl=10, max_entries=8, enabled=False)
+
+        async def work():
+            return 1
+
+        return [(await flight.run("k", work))[1] for _ in range(2)]
+
+    assert asyncio.run(main()) == ["executed", "executed"]
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from app.audio import StreamResampler, resample
+from app.streaming_asr import STT_ENDPOINT_SILENCE_MS, StreamingRecognizer
+
+
+def _pcm(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def _tone(rate: int, seconds: float) -> np.ndarray:
+    return 0.3 * np.sin(2 * np.pi * 300 * np.arange(int(rate * seconds)) / rate)
+
+
+def _feed(recognizer: StreamingRecognizer, samples: np.ndarray, rate: int, chunk_ms: int = 20):
+    step = rate * chunk_ms // 1000
+    for start in range(0, len(samples), step):
+        recognizer.feed(_pcm(samples[start:start + step]))
+        if recognizer.endpoint:
+            return True
+    return False
+
+
+@pytest.mark.parametrize("rate", [16000, 48000])
+def test_silence_after_speech_is_endpoint(rate):
+    recognizer = StreamingRecognizer(rate)
+    assert not _feed(recognizer, _tone(rate, 1.0), rate)
+    assert recognizer.started
+    assert _feed(recognizer, np.zeros(rate * 2), rate)
+    assert recognizer.silence_ms >= STT_ENDPOINT_SILENCE_MS
+    # Ucapan 1 detik ditambah jeda pengaman di kiri-kanan
+    assert 1.0 <= len(recognizer.utterance()) / 16000 <= 1.5
+
+
+def test_silence_only_is_not_endpoint():
+    recognizer = StreamingRecognizer()
+    assert not _feed(recognizer, np.zeros(16000 * 3), 16000)
+    assert not recognizer.started
+
+
+def test_end_after_endpoint_is_ignored():
+    recognizer = StreamingRecognizer()
+    _feed(recognizer, _tone(16000, 1.0), 16000)
+    assert _feed(recognizer, np.zeros(16000 * 2), 16000)
+    recognizer.reset()
+    # {"type": "end"} yang terlambat datang setelah endpointing menutup ucapan
+    recognizer.feed(_pcm(np.zeros(320)))
+    recognizer.end()
+    assert not recognizer.endpoint
+
+
+def test_end_closes_utterance():
+    recognizer = StreamingRecognizer()
+    _feed(recognizer, _tone(16000, 0.5), 16000)
+    recognizer.end()
+    assert recognizer.endpoint
+    assert recognizer.started
+
+
+@pytest.mark.parametrize("rate", [8000, 22050, 44100, 48000])
+def test_stream_resampler_matches_whole_signal(rate):
+    signal = _tone(rate, 1.0).astype(np.float32)
+    resampler = StreamResampler(rate)
+    rng = np.random.default_rng(0)
+    parts, start = [], 0
+    while start < len(signal):
+        size = int(rng.integers(1, rate // 20))
+        parts.append(resampler.process(signal[start:start + size]))
+        start += size
+    parts.append(resampler.process(np.empty(0, dtype=np.float32), final=True))
+    np.testing.assert_allclose(np.concatenate(parts), resample(signal, rate), atol=1e-6)
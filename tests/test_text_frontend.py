@@ -0,0 +1,47 @@
+import pytest
+
+from app.text_frontend import TextFrontend, phonemes_to_text
+
+
+@pytest.fixture(scope="module")
+def g2p():
+    g2p_id = pytest.importorskip("g2p_id")
+    G2P = getattr(g2p_id, "G2P", None) or g2p_id.G2p
+    return G2P()
+
+
+@pytest.mark.parametrize("text", [
+    "Halo, apa kabar? Saya makan nasi di rumah.",
+    "Suhu sekitar 30 derajat dengan angin sepoi-sepoi.",
+    "Apel itu merah.",  # homograf, lewat g2p satu kalimat
+    "Saya tidak tahu—maaf.",
+    "Rapatnya jam 10:30 ya.",
+    "Kita ke café itu.",
+    "Suhu hari ini 25°C.",
+    "Harganya Rp50.000.",
+    "Ya...",
+    "Dr. Budi sudah datang.",
+])
+def test_phonemize_matches_sentence_g2p(g2p, text):
+    frontend = TextFrontend(g2p)
+    expected = phonemes_to_text(g2p(frontend.normalize_numbers(text)))
+    assert isinstance(expected, str)
+    assert frontend.process(text) == expected
+
+
+def test_process_batch_matches_process(g2p):
+    texts = ["Saya makan nasi.", "Kamu makan nasi juga?", "Apel itu merah."]
+    frontend = TextFrontend(g2p)
+    assert frontend.process_batch(texts) == [TextFrontend(g2p).process(text) for text in texts]
+
+
+class _SplitG2P:
+    """G2P tiruan tanpa preprocessing kalimat (seperti g2p-id lama): fonem = huruf kata."""
+
+    def __call__(self, text):
+        return [list(word) for word in text.split()]
+
+
+def test_fallback_tokenizer_keeps_word_boundaries():
+    frontend = TextFrontend(_SplitG2P())
+    assert frontend.process("tahu—maaf, 25°C") == "tahu maaf , dua puluh lima c"
@@ -0,0 +1,108 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.tts_pool import SynthesizerPool, SynthesizerWorker, TTSError
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    # Tanpa proses Coqui: worker dianggap siap dan synthesize_batch diganti per test
+    monkeypatch.setattr(SynthesizerWorker, "start", lambda self, timeout: None)
+    pools = []
+
+    def make(synthesize_batch, **kwargs):
+        options = dict(size=1, model_path="", config_path="", speaker="", health_interval=0,
+                       max_batch_size=4, max_batch_wait=0.05)
+        options.update(kwargs)
+        pool = SynthesizerPool(**options)
+        pool.synthesize_batch = synthesize_batch
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.stop()
+
+
+def _synthesize_all(pool, texts):
+    with ThreadPoolExecutor(len(texts)) as executor:
+        futures = [executor.submit(pool.synthesize, text) for text in texts]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except TTSError as e:
+                results.append(e)
+        return results
+
+
+def test_concurrent_requests_share_one_batch(make_pool):
+    batches = []
+
+    def synthesize_batch(texts):
+        batches.append(list(texts))
+        return [("ok", text.encode()) for text in texts]
+
+    pool = make_pool(synthesize_batch, max_batch_wait=0.2)
+    assert _synthesize_all(pool, ["a", "b", "c"]) == [b"a", b"b", b"c"]
+    assert sorted(len(batch) for batch in batches) == [3]
+
+
+def test_per_text_error_only_fails_that_request(make_pool):
+    pool = make_pool(lambda texts: [("error", "bad") if text == "b" else ("ok", text.encode()) for text in texts])
+    results = _synthesize_all(pool, ["a", "b"])
+    assert results[0] == b"a"
+    assert isinstance(results[1], TTSError) and str(results[1]) == "bad"
+
+
+def test_batch_failure_fails_every_request(make_pool):
+    def synthesize_batch(texts):
+        raise TTSError("TTS worker failed: boom")
+
+    pool = make_pool(synthesize_batch)
+    results = _synthesize_all(pool, ["a", "b"])
+    assert all(isinstance(result, TTSError) for result in results)
+
+
+def test_hung_batch_times_out(make_pool):
+    release = threading.Event()
+
+    def synthesize_batch(texts):
+        release.wait(5)
+        return [("ok", b"") for _ in texts]
+
+    pool = make_pool(synthesize_batch, request_timeout=0.05, startup_timeout=0.05, max_batch_wait=0.01)
+    started = time.monotonic()
+    with pytest.raises(TTSError, match="did not complete"):
+        pool.synthesize("a")
+    # 2 x request_timeout x ukuran batch + satu restart, bukan kelipatan max_batch_size
+    assert time.monotonic() - started < 1
+    release.set()
+
+
+def test_request_gives_up_in_queue_and_is_skipped(make_pool):
+    release = threading.Event()
+    batches = []
+
+    def synthesize_batch(texts):
+        batches.append(list(texts))
+        release.wait(5)
+        return [("ok", text.encode()) for text in texts]
+
+    pool = make_pool(synthesize_batch, request_timeout=0.05, startup_timeout=5, max_batch_size=2,
+                     max_batch_wait=0.01)
+    results = []
+    first = threading.Thread(target=lambda: results.append(pool.synthesize("a")))
+    first.start()
+    time.sleep(0.05)
+    # Satu-satunya worker masih memproses "a"; "b" menyerah setelah satu batch penuh
+    with pytest.raises(TTSError, match="not scheduled"):
+        pool.synthesize("b")
+    release.set()
+    first.join()
+    time.sleep(0.2)
+    assert results == [b"a"]
+    assert batches == [["a"]]